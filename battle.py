@@ -0,0 +1,58 @@
+import random
+from functools import lru_cache
+import numpy as np
+
+# Число боевых раундов в одной битве
+MIN_ROUNDS = 15
+MAX_ROUNDS = 25
+
+
+@lru_cache(maxsize=None)
+def round_probabilities(attacker_power, defender_power):
+    """
+    Точные вероятности исхода одного раунда, в котором стороны бросают
+    randint(1, attacker_power) и randint(1, defender_power).
+    Возвращает (победа атакующего, победа защитника, ничья).
+    """
+    a, d = attacker_power, defender_power
+    total = a * d
+    # Пар с a_roll > d_roll: сумма min(k - 1, d) по k = 1..a
+    t = min(a, d + 1)
+    wins = t * (t - 1) // 2 + max(0, a - d - 1) * d
+    draws = min(a, d)
+    losses = total - wins - draws
+    return wins / total, losses / total, draws / total
+
+
+def _round_probabilities_array(attacker_powers, defender_powers):
+    a = np.asarray(attacker_powers, dtype=np.int64)
+    d = np.asarray(defender_powers, dtype=np.int64)
+    total = a * d
+    t = np.minimum(a, d + 1)
+    wins = t * (t - 1) // 2 + np.maximum(0, a - d - 1) * d
+    draws = np.minimum(a, d)
+    return wins / total, (total - wins - draws) / total
+
+
+def resolve_battle(attacker_power, defender_power):
+    """
+    Разыгрывает битву из случайного числа раундов (15–25) одним
+    мультиномиальным броском. Возвращает (очки атакующего, очки защитника).
+    """
+    rounds = random.randint(MIN_ROUNDS, MAX_ROUNDS)
+    attacker_score, defender_score, _ = np.random.multinomial(
+        rounds, round_probabilities(attacker_power, defender_power))
+    return int(attacker_score), int(defender_score)
+
+
+def resolve_battles(attacker_powers, defender_powers):
+    """
+    Пакетная версия resolve_battle: разыгрывает сразу много битв.
+    Принимает массивы сил сторон, возвращает массивы очков атакующих и защитников.
+    """
+    p_win, p_loss = _round_probabilities_array(attacker_powers, defender_powers)
+    rounds = np.random.randint(MIN_ROUNDS, MAX_ROUNDS + 1, size=p_win.shape)
+    attacker_scores = np.random.binomial(rounds, p_win)
+    # Среди раундов без победы атакующего защитник побеждает с вероятностью p_loss / (1 - p_win)
+    defender_scores = np.random.binomial(rounds - attacker_scores, p_loss / (1 - p_win))
+    return attacker_scores, defender_scores
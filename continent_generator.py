@@ -1,29 +1,304 @@
 import random
 import numpy as np
+from hexgrid import get_adjacency
+from territory import StateBorders, EnclaveTracker, StateCentroids
+
+TERRAIN_OCEAN = 0
+TERRAIN_LAND = 1
+TERRAIN_NAMES = ('ocean', 'land')
+TERRAIN_CODES = {name: code for code, name in enumerate(TERRAIN_NAMES)}
+NO_ID = -1  # отсутствие владельца / водоёма в целочисленных массивах
+
+
+class CellViews(dict):
+    """Представления клеток по плоскому индексу. Объект Cell создаётся
+       при первом обращении, поэтому большая карта поднимается без
+       создания миллионов объектов заранее."""
+    def __init__(self, arrays):
+        super().__init__()
+        self.arrays = arrays
+
+    def __missing__(self, index):
+        cols = self.arrays.cols
+        cell = self[index] = Cell(index % cols, index // cols, self.arrays, index)
+        return cell
+
+
+class GridRow:
+    """Строка сетки: grid[r][q] возвращает представление клетки (r, q)."""
+    __slots__ = ('_cells', '_start', '_cols')
+
+    def __init__(self, cells, start, cols):
+        self._cells = cells
+        self._start = start
+        self._cols = cols
+
+    def __len__(self):
+        return self._cols
+
+    def __getitem__(self, q):
+        if isinstance(q, slice):
+            return [self._cells[self._start + i] for i in range(*q.indices(self._cols))]
+        if q < 0:
+            q += self._cols
+        if not 0 <= q < self._cols:
+            raise IndexError(q)
+        return self._cells[self._start + q]
+
+    def __iter__(self):
+        cells, start = self._cells, self._start
+        for index in range(start, start + self._cols):
+            yield cells[index]
+
+
+class GridArrays:
+    """Хранилище клеток карты в виде плоских массивов (struct-of-arrays).
+       Клетка с координатами (r, q) лежит по индексу r * cols + q.
+       Объекты Cell — лишь лёгкие представления поверх этих массивов."""
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        size = rows * cols
+        self.terrain = np.full(size, TERRAIN_OCEAN, dtype=np.uint8)
+        self.owner = np.full(size, NO_ID, dtype=np.int32)          # state_id
+        self.water_body = np.full(size, NO_ID, dtype=np.int32)     # water_body_id
+        self.oceanic = np.zeros(size, dtype=bool)
+        self.coastal = np.zeros(size, dtype=bool)
+        self.capital = np.zeros(size, dtype=bool)
+        self.coastal_water_ids = {}  # индекс клетки -> список water_body_id (только для побережья)
+        self.palette = {}            # state_id -> цвет, которым закрашиваются клетки государства
+        self.owner_listeners = []    # функции (index, old_owner, new_owner), вызываемые при смене владельца
+        self.owner_version = 0       # растёт при каждой смене владельца клетки
+        self.terrain_version = 0     # растёт при каждом изменении ландшафта
+        self.coastal_version = 0     # растёт при каждой перезаписи прибрежных флагов
+        self.owner_cause = 0         # причина текущих смен владельца (коды CAUSE_* в journal.py)
+        self.cells = CellViews(self)
+
+    @property
+    def adjacency(self):
+        """Общая таблица гекс-соседства для карты этого размера."""
+        return get_adjacency(self.rows, self.cols)
+
+    def set_owner(self, index, owner):
+        """Меняет владельца клетки и оповещает подписанные индексы."""
+        old = self.owner.item(index)
+        if old == owner:
+            return
+        self.owner[index] = owner
+        self.owner_version += 1
+        for listener in self.owner_listeners:
+            listener(index, old, owner)
+
+    def set_owners(self, indices, owners):
+        """Массовая смена владельцев. Без подписчиков — одной операцией над массивом."""
+        if self.owner_listeners:
+            for index, owner in zip(np.asarray(indices).tolist(), np.asarray(owners).tolist()):
+                self.set_owner(index, owner)
+            return
+        self.owner[indices] = owners
+        self.owner_version += 1
+
+    def view(self, name):
+        """Двумерное (rows × cols) представление массива без копирования."""
+        return getattr(self, name).reshape(self.rows, self.cols)
+
+    def adopt(self, cells):
+        """Переносит данные автономных клеток в массивы и делает клетки их представлениями."""
+        for index, cell in enumerate(cells):
+            cell._attach(self, index)
+            self.cells[index] = cell
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['cells']  # представления восстанавливаются по массивам
+        del state['owner_listeners']  # индексы подписываются заново после загрузки
+        return state
+
+    def __setstate__(self, state):
+        self.owner_version = 0
+        self.terrain_version = 0
+        self.coastal_version = 0
+        self.owner_cause = 0
+        self.__dict__.update(state)
+        self.owner_listeners = []
+        self.cells = CellViews(self)
+
+
+def _cell_view(arrays, index):
+    return arrays.cells[index]
+
 
 class Cell:
-    def __init__(self, q, r):
+    __slots__ = ('q', 'r', 'index', '_arrays')
+
+    def __init__(self, q, r, arrays=None, index=0):
         self.q = q  # координата столбца
         self.r = r  # координата строки
-        self.state_id = None  # id государства
-        self.terrain = 'ocean'  # по умолчанию океан
-        # Новые атрибуты для работы с водными объектами
-        self.water_body_id = None   # будет присвоен в label_water_bodies()
-        self.is_oceanic = False       # True, если водоем касается края карты (океан)
-        self.is_coastal = False       # True, если клетка суши примыкает к воде
-        self.coastal_water_ids = []   # список water_body_id водных объектов, к которым примыкает
+        if arrays is None:
+            # Автономная клетка со своим хранилищем из одной ячейки
+            arrays = GridArrays(1, 1)
+            arrays.cells[0] = self
+        self.index = index  # плоский индекс клетки в массивах карты
+        self._arrays = arrays
+
+    def _attach(self, arrays, index):
+        old, i = self._arrays, self.index
+        arrays.terrain[index] = old.terrain[i]
+        arrays.owner[index] = old.owner[i]
+        arrays.water_body[index] = old.water_body[i]
+        arrays.oceanic[index] = old.oceanic[i]
+        arrays.coastal[index] = old.coastal[i]
+        arrays.capital[index] = old.capital[i]
+        if i in old.coastal_water_ids:
+            arrays.coastal_water_ids[index] = old.coastal_water_ids[i]
+        for state_id, color in old.palette.items():
+            arrays.palette.setdefault(state_id, color)
+        self._arrays = arrays
+        self.index = index
+
+    def hex_neighbors(self):
+        """Соседние клетки на гекс-карте (по общей таблице соседства)."""
+        cells = self._arrays.cells
+        return [cells[index] for index in self._arrays.adjacency.neighbors(self.index)]
+
+    def __reduce__(self):
+        return _cell_view, (self._arrays, self.index)
+
+    def __setstate__(self, state):
+        # Клетка из старого pickle, где все атрибуты хранились в __dict__
+        self.__init__(state['q'], state['r'])
+        for name in ('terrain', 'state_id', 'water_body_id', 'is_oceanic', 'is_coastal',
+                     'coastal_water_ids', 'state_color', 'is_capital'):
+            if name in state:
+                setattr(self, name, state[name])
+
+    @property
+    def terrain(self):
+        return TERRAIN_NAMES[self._arrays.terrain.item(self.index)]
+
+    @terrain.setter
+    def terrain(self, value):
+        self._arrays.terrain[self.index] = TERRAIN_CODES[value]
+        self._arrays.terrain_version += 1
+
+    @property
+    def state_id(self):  # id государства
+        value = self._arrays.owner.item(self.index)
+        return None if value == NO_ID else value
+
+    @state_id.setter
+    def state_id(self, value):
+        self._arrays.set_owner(self.index, NO_ID if value is None else value)
+
+    @property
+    def state_color(self):
+        # Цвет берётся из палитры владельца; у ничейной клетки атрибута нет
+        try:
+            return self._arrays.palette[self._arrays.owner.item(self.index)]
+        except KeyError:
+            raise AttributeError('state_color') from None
+
+    @state_color.setter
+    def state_color(self, value):
+        self._arrays.palette[self._arrays.owner.item(self.index)] = value
+
+    @property
+    def water_body_id(self):  # присваивается в label_water_bodies()
+        value = self._arrays.water_body.item(self.index)
+        return None if value == NO_ID else value
+
+    @water_body_id.setter
+    def water_body_id(self, value):
+        self._arrays.water_body[self.index] = NO_ID if value is None else value
+
+    @property
+    def is_oceanic(self):  # True, если водоем касается края карты (океан)
+        return self._arrays.oceanic.item(self.index)
+
+    @is_oceanic.setter
+    def is_oceanic(self, value):
+        self._arrays.oceanic[self.index] = value
+
+    @property
+    def is_coastal(self):  # True, если клетка суши примыкает к воде
+        return self._arrays.coastal.item(self.index)
+
+    @is_coastal.setter
+    def is_coastal(self, value):
+        self._arrays.coastal[self.index] = value
+        self._arrays.coastal_version += 1
+
+    @property
+    def coastal_water_ids(self):  # список water_body_id водных объектов, к которым примыкает
+        return self._arrays.coastal_water_ids.get(self.index, [])
+
+    @coastal_water_ids.setter
+    def coastal_water_ids(self, value):
+        if value:
+            self._arrays.coastal_water_ids[self.index] = list(value)
+        else:
+            self._arrays.coastal_water_ids.pop(self.index, None)
+
+    @property
+    def is_capital(self):
+        return self._arrays.capital.item(self.index)
+
+    @is_capital.setter
+    def is_capital(self, value):
+        self._arrays.capital[self.index] = value
+
 
 class Map: 
+    # Производные индексы строятся по массивам при первом обращении и не сохраняются
+    DERIVED_INDEXES = ('_borders', '_ocean_runs', '_enclaves', '_centroids', '_water_bodies')
+
     def __init__(self, rows, cols, num_continents=3):
         self.rows = rows
         self.cols = cols
         self.num_continents = num_continents
-        self.grid = [[Cell(q, r) for q in range(cols)] for r in range(rows)]
+        self.arrays = GridArrays(rows, cols)
+        self.grid = self._build_grid()
+        for name in self.DERIVED_INDEXES:
+            setattr(self, name, None)
         self.generate_terrain()
         # После генерации ландшафта назначаем водные объекты и помечаем прибрежные клетки
         self.label_water_bodies()
         self.mark_coastal_cells()
 
+    def _build_grid(self):
+        cells = self.arrays.cells
+        return [GridRow(cells, r * self.cols, self.cols) for r in range(self.rows)]
+
+    @classmethod
+    def from_arrays(cls, arrays, num_continents):
+        """Собирает карту поверх готовых массивов клеток (без генерации ландшафта)."""
+        world = cls.__new__(cls)
+        world.rows = arrays.rows
+        world.cols = arrays.cols
+        world.num_continents = num_continents
+        world.arrays = arrays
+        world.grid = world._build_grid()
+        for name in cls.DERIVED_INDEXES:
+            setattr(world, name, None)
+        return world
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['grid']  # строки сетки собираются заново из self.arrays
+        for name in self.DERIVED_INDEXES:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name in self.DERIVED_INDEXES:
+            setattr(self, name, None)
+        if 'arrays' not in state:
+            # Старый pickle: клетки были самостоятельными объектами — переносим их в массивы
+            self.arrays = GridArrays(self.rows, self.cols)
+            self.arrays.adopt(cell for row in self.grid for cell in row)
+        self.grid = self._build_grid()
+
     def generate_terrain(self):
         # Генерация случайных центров континентов
         continent_centers = []
@@ -33,35 +308,84 @@ class Map:
             if all(np.sqrt((cx - x)**2 + (cy - y)**2) > 15 for x, y in continent_centers):
                 continent_centers.append((cy, cx))
 
-        # Генерация континентов с плавными переходами
-        for r in range(self.rows):
-            for q in range(self.cols):
-                distances = [np.sqrt((q - cx)**2 * 0.5 + (r - cy)**2 * 1.5) for cy, cx in continent_centers]  
-                min_dist = min(distances)
-                # Генерация плавных контуров суши (уменьшаем шум и порог)
-                value = np.exp(-min_dist / 8) + np.random.normal(0, 0.05)  
-                if value > 0.5:
-                    self.grid[r][q].terrain = 'land'
-                else:
-                    self.grid[r][q].terrain = 'ocean'
-
-        # Убираем островки из одной клетки
-        for r in range(self.rows):
-            for q in range(self.cols):
-                if self.grid[r][q].terrain == 'land':
-                    # Если нет соседей суши, превращаем в океан
-                    if all(neighbor.terrain == 'ocean' for neighbor in self.get_neighbors(r, q)):
-                        self.grid[r][q].terrain = 'ocean'
+        # Поле расстояний до ближайшего центра считается сразу для всей сетки.
+        # Центры перебираются по одному, чтобы не держать в памяти массив
+        # размером (число центров × rows × cols) на больших картах.
+        r_idx = np.arange(self.rows, dtype=np.float64)[:, None]
+        q_idx = np.arange(self.cols, dtype=np.float64)[None, :]
+        min_dist_sq = np.full((self.rows, self.cols), np.inf)
+        for cy, cx in continent_centers:
+            dist_sq = (q_idx - cx)**2 * 0.5 + (r_idx - cy)**2 * 1.5
+            np.minimum(min_dist_sq, dist_sq, out=min_dist_sq)
+
+        # Генерация плавных контуров суши: шум берётся одним вызовом на всю карту
+        noise = np.random.normal(0, 0.05, size=(self.rows, self.cols))
+        land = np.exp(-np.sqrt(min_dist_sq) / 8) + noise > 0.5
+
+        # Убираем островки из одной клетки: считаем соседей суши сдвигами массива
+        land_neighbors = np.zeros((self.rows, self.cols), dtype=np.int8)
+        land_neighbors[1:, :] += land[:-1, :]
+        land_neighbors[:-1, :] += land[1:, :]
+        land_neighbors[:, 1:] += land[:, :-1]
+        land_neighbors[:, :-1] += land[:, 1:]
+        land &= land_neighbors > 0
 
         # Убираем континенты, которые касаются краёв карты
-        for r in range(self.rows):
-            for q in range(self.cols):
-                if r < 1 or r >= self.rows - 1 or q < 1 or q >= self.cols - 1:
-                    if self.grid[r][q].terrain == 'land':
-                        self.grid[r][q].terrain = 'ocean'
+        land[0, :] = False
+        land[-1, :] = False
+        land[:, 0] = False
+        land[:, -1] = False
+
+        self.arrays.terrain[:] = np.where(land.ravel(), TERRAIN_LAND, TERRAIN_OCEAN)
+        self.arrays.terrain_version += 1
+
+    @property
+    def adjacency(self):
+        return self.arrays.adjacency
+
+    @property
+    def borders(self):
+        """Граф соседства государств; строится при первом обращении
+           и дальше обновляется при каждой смене владельца клетки."""
+        if self._borders is None:
+            self._borders = StateBorders(self.arrays)
+        return self._borders
+
+    @property
+    def enclaves(self):
+        """Связность территорий государств со столицами, обновляемая по сменам владельцев."""
+        if self._enclaves is None:
+            self._enclaves = EnclaveTracker(self.arrays)
+        return self._enclaves
+
+    @property
+    def centroids(self):
+        """Суммы координат территорий государств, обновляемые по сменам владельцев."""
+        if self._centroids is None:
+            self._centroids = StateCentroids(self.arrays)
+        return self._centroids
+
+    @property
+    def ocean_runs(self):
+        """Индекс прямых водных путей; пересобирается после изменения ландшафта или прибрежных флагов."""
+        runs = self._ocean_runs
+        if (runs is None or runs.terrain_version != self.arrays.terrain_version
+                or runs.coastal_version != self.arrays.coastal_version):
+            from naval import OceanRunIndex
+            self._ocean_runs = OceanRunIndex(self.arrays)
+        return self._ocean_runs
+
+    @property
+    def water_bodies(self):
+        """Таблица водоёмов и их берегов; пересобирается только после изменения ландшафта."""
+        if self._water_bodies is None or self._water_bodies.terrain_version != self.arrays.terrain_version:
+            from naval import WaterBodies
+            self._water_bodies = WaterBodies(self.arrays)
+        return self._water_bodies
 
     def get_all_cells(self):
-        return [cell for row in self.grid for cell in row]
+        cells = self.arrays.cells
+        return [cells[index] for index in range(self.rows * self.cols)]
 
     def get_neighbors(self, r, q):
         neighbors = []
@@ -72,42 +396,17 @@ class Map:
         return neighbors
 
     def label_water_bodies(self):
-        """Проходит по всем клеткам с terrain 'ocean' и группирует их в водоёмы.
+        """Группирует клетки океана в водоёмы (таблица naval.WaterBodies).
            Если водоём касается края карты, он помечается как океанический."""
-        water_body_id = 0
-        for r in range(self.rows):
-            for q in range(self.cols):
-                cell = self.grid[r][q]
-                if cell.terrain == 'ocean' and cell.water_body_id is None:
-                    queue = [cell]
-                    water_cells = []
-                    cell.water_body_id = water_body_id
-                    while queue:
-                        current = queue.pop(0)
-                        water_cells.append(current)
-                        for neighbor in self.get_neighbors(current.r, current.q):
-                            if neighbor.terrain == 'ocean' and neighbor.water_body_id is None:
-                                neighbor.water_body_id = water_body_id
-                                queue.append(neighbor)
-                    is_oceanic = any((c.r == 0 or c.r == self.rows - 1 or c.q == 0 or c.q == self.cols - 1) for c in water_cells)
-                    for c in water_cells:
-                        c.is_oceanic = is_oceanic
-                    water_body_id += 1
+        bodies = self.water_bodies
+        water = bodies.labels >= 0
+        self.arrays.water_body[:] = bodies.labels
+        self.arrays.oceanic[:] = water & bodies.oceanic[np.where(water, bodies.labels, 0)]
 
     def mark_coastal_cells(self):
         """Помечает сушу как прибрежную, если у неё есть соседняя водная клетка.
            Также сохраняет список water_body_id, к которым клетка примыкает."""
-        for r in range(self.rows):
-            for q in range(self.cols):
-                cell = self.grid[r][q]
-                if cell.terrain == 'land':
-                    coastal_ids = []
-                    for neighbor in self.get_neighbors(r, q):
-                        if neighbor.terrain == 'ocean':
-                            coastal_ids.append(neighbor.water_body_id)
-                    if coastal_ids:
-                        cell.is_coastal = True
-                        cell.coastal_water_ids = list(set(coastal_ids))
-                    else:
-                        cell.is_coastal = False
-                        cell.coastal_water_ids = []
\ No newline at end of file
+        bodies = self.water_bodies
+        self.arrays.coastal[:] = bodies.coastal
+        self.arrays.coastal_water_ids = bodies.coastal_water_ids()
+        self.arrays.coastal_version += 1
\ No newline at end of file
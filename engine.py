@@ -0,0 +1,169 @@
+import os
+import pickle
+import random
+from continent_generator import Map
+from snapshot import save_snapshot, load_snapshot
+from states import Map as StatesMap, StateList
+from war import simulate_battles, absorb_isolated_groups
+from separatism import trigger_separatism, process_separatist_states
+from ideology import update_state_arrays, get_coalition
+from union import update_unions
+from journal import change_cause, CAUSE_SECESSION, CAUSE_SUPPRESSION, CAUSE_BATTLE, CAUSE_ABSORB
+import metrics
+
+
+def create_world(rows=50, cols=80, num_continents=25):
+    """Генерирует новую карту континентов (без государств)."""
+    return Map(rows=rows, cols=cols, num_continents=num_continents)
+
+
+def load_world(path, mmap=False):
+    """
+    Загружает мир из снимка .npz или из pickle-файла старого формата,
+    приводя старые сохранения к текущему виду.
+    """
+    if path.endswith('.npz'):
+        return load_snapshot(path, mmap=mmap)
+    with open(path, 'rb') as f:
+        world = pickle.load(f)
+    if hasattr(world, 'states') and not isinstance(world.states, StateList):
+        # Старые сохранения хранили государства простым списком
+        world.states = StateList(world.states)
+    return world
+
+
+def save_world(world, path):
+    """Сохраняет мир: снимок .npz для путей с этим расширением, иначе pickle."""
+    if path.endswith('.npz'):
+        save_snapshot(world, path)
+        return
+    with open(path, 'wb') as f:
+        pickle.dump(world, f)
+
+
+def ensure_states(world, count=25):
+    """Создаёт государства на карте, если их ещё нет. Возвращает True, если они созданы."""
+    if hasattr(world, 'states') and world.states:
+        return False
+    states_map = StatesMap(world.rows, world.cols)
+    states_map.grid = world.grid
+    states_map.arrays = world.arrays
+    states_map.generate_states(count=count)
+    world.states = states_map.states
+    return True
+
+
+def update_states(world):
+    """
+    Колебания силы и стабильности, идеологический дрейф и запись истории.
+    Если идеология уже задана, она не сбрасывается, а только корректируется дрейфом.
+    Возвращает записи истории, добавленные на этом шаге.
+    """
+    entries = []
+    update_state_arrays(world.states)
+    for state in world.states:
+        if not hasattr(state, 'history'):
+            state.history = []
+        entry = {
+            'step': world.step,
+            'id': state.id,
+            'name': state.name,
+            'power': state.power,
+            'ideology_x': state.ideology_x,
+            'ideology_y': state.ideology_y,
+            'zone': state.ideology_zone,
+            'stability': state.stability
+        }
+        state.history.append(entry)
+        entries.append(entry)
+    return entries
+
+
+def run_separatism(world):
+    """Отделения и судьба сепаратистов. Возвращает число состоявшихся отделений."""
+    events = 0
+    with metrics.phase('secession'), change_cause(world.arrays, CAUSE_SECESSION):
+        for state in list(world.states):  # копия списка, так как он может измениться
+            if state.stability < 0:
+                if random.random() < 0.25:
+                    if trigger_separatism(state, world, world.step) is not None:
+                        events += 1
+    metrics.count('separatism_events', events)
+    with metrics.phase('separatists'), change_cause(world.arrays, CAUSE_SUPPRESSION):
+        process_separatist_states(world, world.step)
+    return events
+
+
+def run_wars(world):
+    with metrics.phase('battles'), change_cause(world.arrays, CAUSE_BATTLE):
+        simulate_battles(world, world.states, max_battles=5)
+    with metrics.phase('absorb'), change_cause(world.arrays, CAUSE_ABSORB):
+        absorb_isolated_groups(world, threshold=3)
+
+
+def run_unions(world):
+    """Поддерживает унии соседних государств одной коалиции (см. union.update_unions)."""
+    with metrics.phase('unions'):
+        update_unions(world, get_coalition)
+
+
+def advance_step(world, unions=False):
+    """
+    Один шаг симуляции без отрисовки и сохранения.
+    unions=True добавляет в конец шага обновление уний.
+    Возвращает строки журнала показателей за этот шаг — по одной на каждое
+    государство, существовавшее в начале шага (даже если оно затем исчезло).
+    """
+    world.step = world.step + 1 if hasattr(world, 'step') else 1
+    with metrics.phase('update'):
+        entries = update_states(world)
+    run_separatism(world)
+    run_wars(world)
+    if unions:
+        run_unions(world)
+    return entries
+
+
+def run_steps(world, n, on_step=None, journal=None, logs=(), unions=False):
+    """
+    Выполняет n шагов симуляции над миром в памяти.
+    on_step(world) вызывается после каждого шага (например, для контрольных точек).
+    journal – TerritoryJournal, в который пишутся смены владельцев клеток.
+    logs – журналы показателей (statelog), получающие строки каждого шага.
+    unions – поддерживать унии государств на каждом шаге.
+    При включённых замерах (metrics.start) после каждого шага пишется его запись.
+    """
+    for _ in range(n):
+        entries = advance_step(world, unions=unions)
+        with metrics.phase('log'):
+            for log in logs:
+                log.write(entries)
+        if journal is not None:
+            with metrics.phase('journal'):
+                journal.end_step()
+        if on_step is not None:
+            with metrics.phase('after_step'):
+                on_step(world)
+        metrics.end_step(world.step)
+    return world
+
+
+def load_or_create_world(save_file, state_count=25, legacy_file=None):
+    """
+    Загружает мир из save_file или создаёт новый; в обоих случаях гарантирует наличие государств.
+    Если save_file ещё нет, но есть старое сохранение legacy_file, мир берётся из него
+    и сразу переписывается в save_file.
+    """
+    if os.path.exists(save_file):
+        world = load_world(save_file)
+        print("Карта загружена из файла.")
+    elif legacy_file is not None and os.path.exists(legacy_file):
+        world = load_world(legacy_file)
+        save_world(world, save_file)
+        print(f"Старое сохранение {legacy_file} преобразовано в {save_file}.")
+    else:
+        world = create_world()
+        print("Карта сгенерирована.")
+    if ensure_states(world, count=state_count):
+        print("Государства сгенерированы.")
+    return world
@@ -0,0 +1,121 @@
+"""
+Ансамбль независимых прогонов на одном континенте.
+Карта генерируется (или загружается) один раз и сохраняется снимком .npz;
+каждый процесс-исполнитель отображает её массивы в память только для чтения
+(копирование при записи), поэтому ландшафт не копируется и не генерируется заново.
+У каждого прогона свой поток случайных чисел из SeedSequence: модульные
+random и np.random живут в отдельном процессе, так что прогоны не мешают
+друг другу и воспроизводимы при том же исходном зерне.
+"""
+import os
+import io
+import sys
+import random
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import metrics
+from engine import create_world, load_world, save_world, ensure_states, advance_step
+
+ENSEMBLE_METRICS = ('state_count', 'largest_state', 'separatism_events')
+
+
+def seed_streams(seed, runs):
+    """Независимые зёрна (int для random, uint32-массив для np.random) для каждого прогона."""
+    return [child.generate_state(4) for child in np.random.SeedSequence(seed).spawn(runs)]
+
+
+def step_metrics(world, record):
+    """
+    Показатели мира после шага. record – запись шага из metrics.end_step:
+    отделения считаются там, где они происходят, поэтому учитываются
+    и сепаратисты, уничтоженные родителем в том же шаге.
+    """
+    sizes = [len(state.cells) for state in world.states]
+    return {
+        'state_count': len(world.states),
+        'largest_state': max(sizes) if sizes else 0,
+        'separatism_events': record['counters'].get('separatism_events', 0),
+    }
+
+
+def _run_member(task):
+    snapshot_path, seed_words, steps, state_count = task
+    random.seed(int.from_bytes(seed_words.tobytes(), 'little'))
+    np.random.seed(seed_words)
+    values = {name: np.zeros(steps, dtype=np.int64) for name in ENSEMBLE_METRICS}
+    # Симуляция печатает ход событий; в ансамбле он не нужен
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        world = load_world(snapshot_path, mmap=True)
+        ensure_states(world, count=state_count)
+        metrics.start()
+        try:
+            for step in range(steps):
+                advance_step(world)
+                record = metrics.end_step(world.step)
+                for name, value in step_metrics(world, record).items():
+                    values[name][step] = value
+                output.seek(0)
+                output.truncate()
+        finally:
+            metrics.stop()
+    return values
+
+
+def run_ensemble(runs, steps, world=None, seed=0, workers=None, state_count=25):
+    """
+    Выполняет runs независимых прогонов по steps шагов на общем континенте.
+    world – мир-основа (по умолчанию генерируется новый); если у него уже есть
+    государства, все прогоны стартуют с них, иначе каждый создаёт свои.
+    Возвращает словарь: 'seeds' (runs, 4) и массивы (runs, steps) для ENSEMBLE_METRICS.
+    """
+    if world is None:
+        world = create_world()
+    seeds = seed_streams(seed, runs)
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, 'terrain.npz')
+        save_world(world, snapshot_path)
+        tasks = [(snapshot_path, words, steps, state_count) for words in seeds]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            members = list(pool.map(_run_member, tasks))
+    result = {'seeds': np.array(seeds)}
+    for name in ENSEMBLE_METRICS:
+        result[name] = np.array([member[name] for member in members]).reshape(runs, steps)
+    return result
+
+
+def summarize(result):
+    """Среднее и разброс каждого показателя по прогонам на каждом шаге."""
+    return {name: (result[name].mean(axis=0), result[name].std(axis=0)) for name in ENSEMBLE_METRICS}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ансамбль прогонов симуляции на одном континенте.")
+    parser.add_argument('--runs', type=int, default=8, help="число независимых прогонов")
+    parser.add_argument('--steps', type=int, default=100, help="шагов в каждом прогоне")
+    parser.add_argument('--workers', type=int, default=None, help="число процессов (по умолчанию — по ядрам)")
+    parser.add_argument('--seed', type=int, default=0, help="исходное зерно ансамбля")
+    parser.add_argument('--world', metavar='PATH', help="взять континент из сохранения вместо генерации")
+    parser.add_argument('--out', metavar='PATH', default='ensemble.npz', help="куда сохранить показатели")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    world = load_world(args.world) if args.world else None
+    if world is None:
+        # Континент общий для всех прогонов, поэтому и он зависит от исходного зерна
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+    result = run_ensemble(args.runs, args.steps, world=world, seed=args.seed, workers=args.workers)
+    np.savez(args.out, **result)
+    for name, (mean, std) in summarize(result).items():
+        print(f"{name}: в конце {mean[-1]:.1f} ± {std[-1]:.1f}")
+    print(f"Показатели {args.runs} прогонов сохранены в {args.out}.")
+    return result
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
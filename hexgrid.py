@@ -0,0 +1,117 @@
+from functools import lru_cache
+import numpy as np
+
+# Смещения соседей (dr, dq) для чётных и нечётных строк offset-сетки.
+# Порядок направлений общий для всех модулей: он же номер ребра в visualize.
+HEX_OFFSETS_EVEN = ((-1, -1), (-1, 0), (0, -1), (0, 1), (1, -1), (1, 0))
+HEX_OFFSETS_ODD = ((-1, 0), (-1, 1), (0, -1), (0, 1), (1, 0), (1, 1))
+
+
+def cell_positions(indices, cols):
+    """Центры клеток (сторона шестиугольника 1) по плоским индексам: массивы x, y."""
+    r, q = np.divmod(indices, cols)
+    return np.sqrt(3) * (q + 0.5 * (r % 2)), 1.5 * r
+
+
+class HexAdjacency:
+    """
+    Таблица соседства гекс-сетки rows × cols, построенная один раз.
+    Клетки задаются плоским индексом r * cols + q.
+      table   – массив (rows*cols, 6): сосед по каждому направлению или -1 за краем карты;
+      indptr, indices – те же соседи в формате CSR (только существующие).
+    """
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        size = rows * cols
+        r = np.repeat(np.arange(rows), cols)
+        q = np.tile(np.arange(cols), rows)
+        offsets = np.where((r % 2 == 0)[:, None, None],
+                           np.array(HEX_OFFSETS_EVEN)[None], np.array(HEX_OFFSETS_ODD)[None])
+        nr = r[:, None] + offsets[:, :, 0]
+        nq = q[:, None] + offsets[:, :, 1]
+        valid = (nr >= 0) & (nr < rows) & (nq >= 0) & (nq < cols)
+        self.table = np.where(valid, nr * cols + nq, -1).astype(np.int32)
+        self.indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(valid.sum(axis=1), out=self.indptr[1:])
+        self.indices = self.table[valid]
+        self._edges = None
+        self._cube = None
+
+    def neighbors(self, index):
+        """Список плоских индексов соседей клетки index (срез CSR, без кэша на клетку)."""
+        return self.indices[self.indptr.item(index):self.indptr.item(index + 1)].tolist()
+
+    def edges(self):
+        """Все рёбра сетки один раз: массивы (u, v) плоских индексов с u < v."""
+        if self._edges is None:
+            cells, directions = np.nonzero(self.table >= 0)
+            neighbors = self.table[cells, directions]
+            forward = cells < neighbors
+            self._edges = (cells[forward], neighbors[forward].astype(np.int64))
+        return self._edges
+
+    def cube(self):
+        """
+        Кубические координаты (x, z) всех клеток (y = -x - z).
+        Нечётные строки сдвинуты вправо, как в HEX_OFFSETS_ODD.
+        """
+        if self._cube is None:
+            r = np.repeat(np.arange(self.rows), self.cols)
+            q = np.tile(np.arange(self.cols), self.rows)
+            self._cube = (q - (r - (r & 1)) // 2, r)
+        return self._cube
+
+    def distances(self, source, indices):
+        """Гекс-расстояния (число шагов по соседям) от клетки source до клеток indices."""
+        x, z = self.cube()
+        dx = x[indices] - x.item(source)
+        dz = z[indices] - z.item(source)
+        return np.maximum(np.maximum(np.abs(dx), np.abs(dz)), np.abs(dx + dz))
+
+    def neighbor_coords(self, r, q):
+        """Соседи клетки (r, q) в виде списка координат (nr, nq)."""
+        return [divmod(index, self.cols) for index in self.neighbors(r * self.cols + q)]
+
+
+def label_components(size, u, v):
+    """
+    Разметка связных компонент графа на вершинах 0..size-1 с рёбрами (u[i], v[i]).
+    Корни компонент подвешиваются к меньшему соседнему корню, после чего
+    выполняется сжатие путей; каждый проход полностью векторизован,
+    а число проходов растёт логарифмически с размером компонент.
+    Возвращает (метки 0..k-1 в порядке первой клетки компоненты, k).
+    """
+    parent = np.arange(size)
+    u = np.asarray(u, dtype=np.int64)
+    v = np.asarray(v, dtype=np.int64)
+    while len(u):
+        root_u = parent[u]
+        root_v = parent[v]
+        different = root_u != root_v
+        if not different.any():
+            break
+        u, v = u[different], v[different]
+        root_u, root_v = root_u[different], root_v[different]
+        np.minimum.at(parent, np.maximum(root_u, root_v), np.minimum(root_u, root_v))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    roots, labels = np.unique(parent, return_inverse=True)
+    return labels, len(roots)
+
+
+def orthogonal_edges(rows, cols):
+    """Рёбра 4-связной прямоугольной решётки rows × cols: массивы (u, v) с u < v."""
+    index = np.arange(rows * cols).reshape(rows, cols)
+    u = np.concatenate([index[:, :-1].ravel(), index[:-1, :].ravel()])
+    v = np.concatenate([index[:, 1:].ravel(), index[1:, :].ravel()])
+    return u, v
+
+
+@lru_cache(maxsize=None)
+def get_adjacency(rows, cols):
+    """Общая таблица соседства для карты данного размера."""
+    return HexAdjacency(rows, cols)
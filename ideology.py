@@ -1,4 +1,5 @@
 import random
+import numpy as np
 
 def assign_random_ideology(state):
     state.ideology_x = random.randint(-10, 10)
@@ -8,7 +9,7 @@ def ideological_drift(state):
     state.ideology_x = max(-10, min(10, state.ideology_x + random.randint(-3, 3)))
     state.ideology_y = max(-10, min(10, state.ideology_y + random.randint(-3, 3)))
 
-def get_ideology_zone(x, y):
+def _zone_by_ranges(x, y):
     if x == 0 or y == 0:
         return "нейтральная зона"
     if (-10 <= x <= -3 and 7 <= y <= 10) or (-10 <= x <= -7 and 3 <= y <= 6):
@@ -29,24 +30,88 @@ def get_ideology_zone(x, y):
         return "жёлтый"
     return "неизвестно"
 
+# Координаты идеологии — целые числа в [-10, 10], поэтому зона, коалиция и
+# радикальность заранее посчитаны для всех 21 × 21 точек.
+IDEOLOGY_MIN = -10
+IDEOLOGY_MAX = 10
+ZONE_NAMES = ("нейтральная зона", "ультра-красный", "ультра-синий", "ультра-зелёный", "ультра-жёлтый",
+              "красный", "синий", "зелёный", "жёлтый", "неизвестно")
+ZONE_CODES = {name: code for code, name in enumerate(ZONE_NAMES)}
+
 def get_coalition(zone):
     """Возвращает коалиционное имя: для ультра-версии отбрасываем префикс 'ультра-'."""
     if zone.startswith("ультра-"):
         return zone[len("ультра-"):]
     return zone
 
+_SPAN = np.arange(IDEOLOGY_MIN, IDEOLOGY_MAX + 1)
+# ZONE_TABLE[x + 10, y + 10] — код зоны точки (x, y)
+ZONE_TABLE = np.array([[ZONE_CODES[_zone_by_ranges(x, y)] for y in _SPAN.tolist()] for x in _SPAN.tolist()],
+                      dtype=np.int8)
+# Код коалиции (код неультра-зоны) и радикальность по коду зоны
+COALITION_OF_ZONE = np.array([ZONE_CODES[get_coalition(name)] for name in ZONE_NAMES], dtype=np.int8)
+RADICAL_ZONE = np.array([name.startswith("ультра") for name in ZONE_NAMES])
+# ATTACK_TABLE[зона атакующего, зона защищающегося] — правила can_attack
+ATTACK_TABLE = (RADICAL_ZONE[:, None]
+                & (np.arange(len(ZONE_NAMES)) != ZONE_CODES["нейтральная зона"])[None, :]
+                & (COALITION_OF_ZONE[:, None] != COALITION_OF_ZONE[None, :]))
+
+def zone_code(x, y):
+    """Код зоны по координатам; вне таблицы — по исходным диапазонам."""
+    if IDEOLOGY_MIN <= x <= IDEOLOGY_MAX and IDEOLOGY_MIN <= y <= IDEOLOGY_MAX:
+        return int(ZONE_TABLE[x - IDEOLOGY_MIN, y - IDEOLOGY_MIN])
+    return ZONE_CODES[_zone_by_ranges(x, y)]
+
+def get_ideology_zone(x, y):
+    return ZONE_NAMES[zone_code(x, y)]
+
 def is_radical(state):
-    zone = get_ideology_zone(state.ideology_x, state.ideology_y)
-    return zone.startswith("ультра")
+    return bool(RADICAL_ZONE[zone_code(state.ideology_x, state.ideology_y)])
 
 def can_attack(attacker, defender):
-    # Нельзя атаковать нейтральное государство
-    if get_ideology_zone(defender.ideology_x, defender.ideology_y) == "нейтральная зона":
-        return False
-    if not is_radical(attacker):
-        return False
-    attacker_zone = get_ideology_zone(attacker.ideology_x, attacker.ideology_y)
-    defender_zone = get_ideology_zone(defender.ideology_x, defender.ideology_y)
-    if get_coalition(attacker_zone) == get_coalition(defender_zone):
-        return False
-    return True
+    # Нельзя атаковать нейтральное государство, атакуют только радикалы чужой коалиции
+    return bool(ATTACK_TABLE[zone_code(attacker.ideology_x, attacker.ideology_y),
+                             zone_code(defender.ideology_x, defender.ideology_y)])
+
+def attack_pairs(states):
+    """
+    Все пары, для которых can_attack истинно: массивы индексов в states
+    (атакующие, защищающиеся) в порядке двойного цикла по states.
+    Зоны считаются один раз на государство; объекты пар не создаются.
+    """
+    codes = np.array([zone_code(state.ideology_x, state.ideology_y) for state in states], dtype=np.intp)
+    allowed = ATTACK_TABLE[codes[:, None], codes[None, :]]
+    np.fill_diagonal(allowed, False)
+    return np.nonzero(allowed)
+
+def update_state_arrays(states, rng=np.random):
+    """
+    Шаг показателей для всех государств разом: колебание силы и стабильности
+    (общий сдвиг от -3 до 3), случайная идеология для государств без неё,
+    дрейф идеологии у остальных и пересчёт зоны.
+    Возвращает словарь массивов power, stability, ideology_x, ideology_y, zone (коды зон).
+    """
+    count = len(states)
+    power = np.array([state.power for state in states], dtype=np.int64)
+    stability = np.array([state.stability for state in states], dtype=np.int64)
+    unset = np.array([state.ideology_x is None or state.ideology_y is None for state in states], dtype=bool)
+    x = np.array([0 if value is None else value for value in (state.ideology_x for state in states)], dtype=np.int64)
+    y = np.array([0 if value is None else value for value in (state.ideology_y for state in states)], dtype=np.int64)
+
+    delta = rng.randint(-3, 4, size=count)
+    power = np.maximum(power + delta, 10)
+    stability = np.clip(stability + delta, -10, 10)
+
+    drift = rng.randint(-3, 4, size=(2, count))
+    fresh = rng.randint(IDEOLOGY_MIN, IDEOLOGY_MAX + 1, size=(2, count))
+    x = np.where(unset, fresh[0], np.clip(x + drift[0], IDEOLOGY_MIN, IDEOLOGY_MAX))
+    y = np.where(unset, fresh[1], np.clip(y + drift[1], IDEOLOGY_MIN, IDEOLOGY_MAX))
+    zone = ZONE_TABLE[x - IDEOLOGY_MIN, y - IDEOLOGY_MIN]
+
+    for state, p, s, sx, sy, z in zip(states, power.tolist(), stability.tolist(), x.tolist(), y.tolist(), zone.tolist()):
+        state.power = p
+        state.stability = s
+        state.ideology_x = sx
+        state.ideology_y = sy
+        state.ideology_zone = ZONE_NAMES[z]
+    return {'power': power, 'stability': stability, 'ideology_x': x, 'ideology_y': y, 'zone': zone}
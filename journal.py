@@ -0,0 +1,230 @@
+"""
+Журнал территориальных изменений: двоичный файл, в который только дописываются
+события смены владельца клеток (шаг, клетка, старый и новый владелец, причина).
+
+Формат файла:
+  заголовок   – b'WSJ' + версия (1 байт) + rows, cols (int32);
+  блок 'K'    – опорный кадр: шаг (uint32) и весь массив владельцев (int32);
+  блок 'D'    – пачка событий: их число (uint32) и записи EVENT_DTYPE.
+Владельцы на любом шаге восстанавливаются по ближайшему предыдущему
+опорному кадру и событиям после него, поэтому полные снимки на каждом
+шаге хранить не нужно.
+"""
+import os
+from contextlib import contextmanager
+import numpy as np
+
+JOURNAL_MAGIC = b'WSJ'
+JOURNAL_VERSION = 1
+
+# Причины смены владельца
+CAUSE_OTHER = 0
+CAUSE_BATTLE = 1
+CAUSE_ABSORB = 2
+CAUSE_SECESSION = 3
+CAUSE_SUPPRESSION = 4
+CAUSE_UNION_BATTLE = 5
+CAUSE_TRANSFER = 6
+CAUSE_NAMES = {
+    CAUSE_OTHER: "прочее",
+    CAUSE_BATTLE: "битва",
+    CAUSE_ABSORB: "поглощение анклава",
+    CAUSE_SECESSION: "отделение",
+    CAUSE_SUPPRESSION: "подавление сепаратизма",
+    CAUSE_UNION_BATTLE: "битва унии",
+    CAUSE_TRANSFER: "ручная передача",
+}
+
+EVENT_DTYPE = np.dtype([('step', '<u4'), ('cell', '<i4'), ('old', '<i4'), ('new', '<i4'), ('cause', 'u1')])
+_HEADER_DTYPE = np.dtype('<i4')
+_COUNT_DTYPE = np.dtype('<u4')
+_HEADER_SIZE = len(JOURNAL_MAGIC) + 1 + 2 * _HEADER_DTYPE.itemsize
+
+
+@contextmanager
+def change_cause(arrays, cause):
+    """Помечает смены владельца внутри блока with причиной cause."""
+    previous = arrays.owner_cause
+    arrays.owner_cause = cause
+    try:
+        yield
+    finally:
+        arrays.owner_cause = previous
+
+
+class TerritoryJournal:
+    """
+    Пишет смены владельцев клеток мира world в файл path.
+    События копятся в памяти и сбрасываются пачками по batch_size;
+    раз в keyframe_every шагов (и при открытии) пишется опорный кадр.
+    """
+    def __init__(self, world, path, batch_size=4096, keyframe_every=100):
+        self.world = world
+        self.arrays = world.arrays
+        self.path = path
+        self.batch_size = batch_size
+        self.keyframe_every = keyframe_every
+        self._events = []
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            rows, cols = _read_header(path)
+            if (rows, cols) != (self.arrays.rows, self.arrays.cols):
+                raise ValueError(f"Журнал {path} ведётся для карты {rows}x{cols}, "
+                                 f"а не {self.arrays.rows}x{self.arrays.cols}")
+        self._file = open(path, 'ab')
+        if not exists:
+            self._file.write(JOURNAL_MAGIC + bytes([JOURNAL_VERSION]))
+            self._file.write(np.array([self.arrays.rows, self.arrays.cols], dtype=_HEADER_DTYPE).tobytes())
+        # Опорный кадр при открытии: продолжение после загрузки старой контрольной
+        # точки перекрывает события, записанные после неё
+        self.write_keyframe()
+        self.arrays.owner_listeners.append(self.on_owner_change)
+
+    def on_owner_change(self, index, old, new):
+        self._events.append((getattr(self.world, 'step', 0), index, old, new, self.arrays.owner_cause))
+
+    def flush(self):
+        """Дописывает накопленные события в файл."""
+        if not self._events:
+            return
+        events = np.array(self._events, dtype=EVENT_DTYPE)
+        self._events = []
+        self._file.write(b'D')
+        self._file.write(np.array([len(events)], dtype=_COUNT_DTYPE).tobytes())
+        self._file.write(events.tobytes())
+        self._file.flush()
+
+    def write_keyframe(self):
+        """Сохраняет весь массив владельцев на текущем шаге."""
+        self.flush()
+        self._file.write(b'K')
+        self._file.write(np.array([getattr(self.world, 'step', 0)], dtype=_COUNT_DTYPE).tobytes())
+        self._file.write(self.arrays.owner.astype(_HEADER_DTYPE, copy=False).tobytes())
+        self._file.flush()
+
+    def end_step(self):
+        """Вызывается после каждого шага симуляции."""
+        step = getattr(self.world, 'step', 0)
+        if self.keyframe_every and step % self.keyframe_every == 0:
+            self.write_keyframe()
+        elif len(self._events) >= self.batch_size:
+            self.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+        if self.on_owner_change in self.arrays.owner_listeners:
+            self.arrays.owner_listeners.remove(self.on_owner_change)
+
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        head = f.read(_HEADER_SIZE)
+    if len(head) < _HEADER_SIZE or head[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC:
+        raise ValueError(f"{path} не является журналом территорий")
+    version = head[len(JOURNAL_MAGIC)]
+    if version > JOURNAL_VERSION:
+        raise ValueError(f"Журнал версии {version} новее поддерживаемой ({JOURNAL_VERSION})")
+    rows, cols = np.frombuffer(head, dtype=_HEADER_DTYPE, offset=len(JOURNAL_MAGIC) + 1).tolist()
+    return rows, cols
+
+
+class JournalReader:
+    """
+    Чтение журнала и восстановление владельцев клеток на любом шаге.
+    Файл отображается в память; при открытии строится только оглавление блоков.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.rows, self.cols = _read_header(path)
+        size = self.rows * self.cols
+        self._data = np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.zeros(0, np.uint8)
+        self._keyframes = []  # (номер блока, шаг, массив владельцев)
+        self._deltas = []     # (номер блока, записи событий)
+        offset, block = _HEADER_SIZE, 0
+        data = self._data
+        while offset + 1 + _COUNT_DTYPE.itemsize <= len(data):
+            kind = bytes(data[offset:offset + 1])
+            value = int(np.frombuffer(data, dtype=_COUNT_DTYPE, count=1, offset=offset + 1)[0])
+            offset += 1 + _COUNT_DTYPE.itemsize
+            if kind == b'K':
+                end = offset + size * _HEADER_DTYPE.itemsize
+                if end > len(data):
+                    break  # недописанный хвост
+                self._keyframes.append((block, value, np.frombuffer(data, dtype=_HEADER_DTYPE, count=size, offset=offset)))
+            elif kind == b'D':
+                end = offset + value * EVENT_DTYPE.itemsize
+                if end > len(data):
+                    break
+                self._deltas.append((block, np.frombuffer(data, dtype=EVENT_DTYPE, count=value, offset=offset)))
+            else:
+                raise ValueError(f"Повреждённый журнал {path}: неизвестный блок {kind!r}")
+            offset = end
+            block += 1
+
+    def keyframe_steps(self):
+        return [step for _, step, _ in self._keyframes]
+
+    def last_step(self):
+        """Последний шаг, о котором есть сведения в журнале."""
+        steps = [step for _, step, _ in self._keyframes]
+        steps.extend(int(events['step'].max()) for _, events in self._deltas if len(events))
+        return max(steps) if steps else None
+
+    def _base(self, step):
+        # Последний по записи опорный кадр не позже step
+        for block, keyframe_step, owner in reversed(self._keyframes):
+            if keyframe_step <= step:
+                return block, owner
+        raise ValueError(f"В журнале нет опорного кадра не позже шага {step}")
+
+    def events(self, start=None, stop=None):
+        """События с шагом в полуинтервале [start, stop) в порядке записи."""
+        chunks = []
+        for _, events in self._deltas:
+            mask = np.ones(len(events), dtype=bool)
+            if start is not None:
+                mask &= events['step'] >= start
+            if stop is not None:
+                mask &= events['step'] < stop
+            chunks.append(events[mask])
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=EVENT_DTYPE)
+
+    def _apply(self, owner, block, after, step):
+        # События после блока block с шагом в (after, step]; записи упорядочены
+        # по времени, поэтому для каждой клетки берётся последняя смена
+        for delta_block, events in self._deltas:
+            if delta_block < block:
+                continue
+            events = events[(events['step'] > after) & (events['step'] <= step)] if after is not None \
+                else events[events['step'] <= step]
+            if not len(events):
+                continue
+            cells = events['cell'][::-1]
+            cells, last = np.unique(cells, return_index=True)
+            owner[cells] = events['new'][::-1][last]
+        return owner
+
+    def owner_at(self, step):
+        """Массив владельцев клеток (плоский, int32) на конец шага step."""
+        block, owner = self._base(step)
+        return self._apply(owner.copy(), block, None, step)
+
+    def frames(self, steps):
+        """
+        Владельцы на каждом шаге из steps (по возрастанию) в виде массивов rows × cols.
+        Пока опорный кадр не меняется, следующий кадр получается из предыдущего
+        применением только новых событий.
+        """
+        current_block, owner, previous = None, None, None
+        for step in steps:
+            block, base = self._base(step)
+            if block != current_block or previous is None or step < previous:
+                current_block = block
+                owner = self._apply(base.copy(), block, None, step)
+            else:
+                owner = self._apply(owner, block, previous, step)
+            previous = step
+            yield owner.reshape(self.rows, self.cols)
@@ -1,88 +1,92 @@
-import os
-import pickle
-import random 
-import csv 
-from continent_generator import Map  
-from visualize import draw_hex_map
-from states import Map as StatesMap
-from war import simulate_battles, absorb_isolated_groups
-from separatism import trigger_separatism, process_separatist_states
-from ideology import assign_random_ideology, ideological_drift, get_ideology_zone, get_coalition
- 
-save_file = 'saved_map.pkl'
-map_loaded = os.path.exists(save_file)
+import argparse
+from visualize import draw_hex_map, render_map
+from engine import load_or_create_world, save_world, run_steps
+from journal import TerritoryJournal
+from statelog import CsvStateLog, ColumnarStateLog
+from raster import FrameExporter
+import metrics
 
-if map_loaded:
-    with open(save_file, 'rb') as f:
-        hex_map = pickle.load(f)
-    print("Карта загружена из файла.")
-else:
-    hex_map = Map(rows=50, cols=80, num_continents=25)
-    print("Карта сгенерирована.")
+save_file = 'saved_map.npz'
+legacy_save_file = 'saved_map.pkl'  # сохранения до перехода на снимки .npz
+log_file = "state_log.csv"
 
-if not hasattr(hex_map, 'states') or not hex_map.states:
-    states_map = StatesMap(hex_map.rows, hex_map.cols)
-    states_map.grid = hex_map.grid
-    states_map.generate_states(count=25)
-    hex_map.states = states_map.states
-    print("Государства сгенерированы.")
 
-if not hasattr(hex_map, 'step'):
-    hex_map.step = 1
-else:
-    hex_map.step += 1
- 
-# Если идеология уже задана, не сбрасываем, а только корректируем дрейфом.
-for state in hex_map.states:
-    delta = random.randint(-3, 3)
-    state.power += delta
-    state.power = max(10, state.power)
-    state.stability += delta
-    state.stability = max(-10, min(state.stability, 10))
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Симуляция государств на случайном континенте.")
+    parser.add_argument('--steps', type=int, default=1,
+                        help="сколько шагов выполнить за один запуск (мир остаётся в памяти)")
+    parser.add_argument('--no-render', action='store_true',
+                        help="не рисовать карту после последнего шага")
+    parser.add_argument('--render-to', metavar='PATH',
+                        help="сохранить карту в файл изображения вместо показа окна")
+    parser.add_argument('--checkpoint-every', type=int, default=0,
+                        help="сохранять мир каждые N шагов (0 — только в конце)")
+    parser.add_argument('--unions', action='store_true',
+                        help="поддерживать унии соседних государств одной коалиции")
+    parser.add_argument('--journal', metavar='PATH',
+                        help="дописывать смены владельцев клеток в двоичный журнал PATH")
+    parser.add_argument('--keyframe-every', type=int, default=100,
+                        help="как часто (в шагах) писать в журнал полный кадр владельцев")
+    parser.add_argument('--columnar-log', metavar='DIR',
+                        help="дублировать журнал показателей в столбцовом виде (куски .npz в каталоге DIR)")
+    parser.add_argument('--frames', metavar='PATH',
+                        help="кадр карты на каждом шаге: каталог для PNG или файл *.gif")
+    parser.add_argument('--frame-every', type=int, default=1,
+                        help="писать кадр каждые N шагов")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="дописывать замеры каждого шага (время фаз, счётчики) в PATH строками JSON")
+    parser.add_argument('--profile-dir', metavar='DIR',
+                        help="профилировать каждую фазу cProfile и сохранить профили <фаза>.prof в DIR")
+    return parser.parse_args(argv)
 
-    if state.ideology_x is None or state.ideology_y is None:
-        assign_random_ideology(state)
-    else:
-        ideological_drift(state)
-    state.ideology_zone = get_ideology_zone(state.ideology_x, state.ideology_y)
 
-    if not hasattr(state, 'history'):
-        state.history = []
-    state.history.append({
-        'step': hex_map.step,      
-        'id': state.id,
-        'name': state.name,
-        'power': state.power,
-        'ideology_x': state.ideology_x,
-        'ideology_y': state.ideology_y,
-        'zone': state.ideology_zone,
-        'stability': state.stability
-    })
+def main(argv=None):
+    args = parse_args(argv)
+    if args.metrics or args.profile_dir:
+        metrics.start(args.metrics, args.profile_dir)
+    with metrics.phase('load'):
+        hex_map = load_or_create_world(save_file, legacy_file=legacy_save_file)
+    metrics.attach(hex_map.arrays)
 
-for state in list(hex_map.states):  # копия списка, так как он может измениться
-    if state.stability < 0:
-        if random.random() < 0.25:
-            trigger_separatism(state, hex_map, hex_map.step)
-process_separatist_states(hex_map, hex_map.step)
+    logs = [CsvStateLog(log_file)]
+    if args.columnar_log:
+        logs.append(ColumnarStateLog(args.columnar_log))
 
-simulate_battles(hex_map, hex_map.states, max_battles=5)
-absorb_isolated_groups(hex_map, threshold=3)
-draw_hex_map(hex_map)  
+    frames = FrameExporter(hex_map, args.frames, every=args.frame_every) if args.frames else None
 
-log_file = "state_log.csv"
-file_exists = os.path.exists(log_file)
-with open(log_file, "a", newline='', encoding="utf-8") as f:
-    fieldnames = ['step', 'id', 'name', 'power', 'ideology_x', 'ideology_y', 'zone', 'stability']
-    writer = csv.DictWriter(f, fieldnames=fieldnames)
-    if not file_exists:
-        writer.writeheader()
-    # Записываем историю для каждого государства, независимо от того, было ли оно уничтожено.
-    for state in hex_map.states:
-        for entry in state.history:
-            # Если по каким-то причинам в записи нет поля id, добавляем его.
-            if "id" not in entry:
-                entry["id"] = state.id
-            writer.writerow(entry)
- 
-with open(save_file, 'wb') as f:
-    pickle.dump(hex_map, f)
+    def after_step(world):
+        if frames is not None:
+            frames.capture(world)
+        if args.checkpoint_every and world.step % args.checkpoint_every == 0:
+            for log in logs:
+                log.flush()
+            save_world(world, save_file)
+            print(f"Контрольная точка: шаг {world.step}.")
+
+    journal = TerritoryJournal(hex_map, args.journal, keyframe_every=args.keyframe_every) if args.journal else None
+    try:
+        run_steps(hex_map, args.steps, on_step=after_step, journal=journal, logs=logs,
+                  unions=args.unions)
+    finally:
+        if journal is not None:
+            journal.close()
+        if frames is not None:
+            frames.close()
+        for log in logs:
+            log.close()
+    try:
+        with metrics.phase('render'):
+            if args.render_to:
+                render_map(hex_map, args.render_to)
+            elif not args.no_render:
+                draw_hex_map(hex_map)
+
+        with metrics.phase('save'):
+            save_world(hex_map, save_file)
+    finally:
+        metrics.stop(getattr(hex_map, 'step', 0))
+    return hex_map
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Встроенные замеры симуляции: время фаз шага, счётчики событий и профили.
+
+По умолчанию замеры выключены: phase() возвращает пустой контекст,
+а count() сразу выходит, поэтому вызовы в коде симуляции почти ничего не стоят
+(в горячих циклах значение копится локально и передаётся одним вызовом count()).
+start() включает запись: end_step() после каждого шага дописывает в файл
+JSON-строку вида
+  {"step": 12, "kind": "step", "seconds": 0.031,
+   "phases": {"battles": 0.012, ...},
+   "counters": {"battles_attempted": 7, "cells_transferred": 40, ...},
+   "transfers": {"битва": 38, "поглощение анклава": 2}}
+и обнуляет накопленное. seconds — всё время с предыдущей записи,
+transfers — сменившие владельца клетки по причинам (journal.CAUSE_NAMES).
+С profile_dir каждая фаза дополнительно профилируется cProfile
+(один профиль на фазу за весь прогон); профили сохраняются в stop()
+в файлы <фаза>.prof, которые читаются модулем pstats.
+"""
+import os
+import json
+import time
+import cProfile
+from contextlib import contextmanager, nullcontext
+from journal import CAUSE_NAMES
+
+_NO_PHASE = nullcontext()
+_recorder = None
+
+
+class MetricsRecorder:
+    """Накопитель замеров между записями; arrays — GridArrays для подсчёта смен владельцев."""
+    def __init__(self, path=None, profile_dir=None, arrays=None):
+        self.path = path
+        self.profile_dir = profile_dir
+        self.arrays = None
+        self.phases = {}
+        self.counters = {}
+        self.transfers = {}
+        self.profiles = {}
+        self._profiling = False
+        self._last = time.perf_counter()
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+        if arrays is not None:
+            self.attach(arrays)
+
+    def attach(self, arrays):
+        """Подписывается на смены владельцев клеток arrays (вместо прежних)."""
+        self.detach()
+        self.arrays = arrays
+        arrays.owner_listeners.append(self.on_owner_change)
+
+    def detach(self):
+        if self.arrays is not None and self.on_owner_change in self.arrays.owner_listeners:
+            self.arrays.owner_listeners.remove(self.on_owner_change)
+        self.arrays = None
+
+    def on_owner_change(self, index, old, new):
+        cause = self.arrays.owner_cause
+        self.transfers[cause] = self.transfers.get(cause, 0) + 1
+
+    @contextmanager
+    def phase(self, name):
+        profile = None
+        # cProfile не допускает вложенных профилировщиков: вложенная фаза только замеряется
+        if self.profile_dir and not self._profiling:
+            profile = self.profiles.get(name)
+            if profile is None:
+                profile = self.profiles[name] = cProfile.Profile()
+            self._profiling = True
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+
+    def pending(self):
+        return bool(self.phases or self.counters or self.transfers)
+
+    def record(self, step, kind='step'):
+        """Запись о накопленном с прошлой записи; пишется в файл и возвращается."""
+        now = time.perf_counter()
+        counters = dict(self.counters)
+        if self.arrays is not None:
+            counters['cells_transferred'] = sum(self.transfers.values())
+        record = {
+            'step': step,
+            'kind': kind,
+            'seconds': round(now - self._last, 6),
+            'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            'counters': counters,
+            'transfers': {CAUSE_NAMES.get(cause, str(cause)): cells for cause, cells in sorted(self.transfers.items())},
+        }
+        self.phases = {}
+        self.counters = {}
+        self.transfers = {}
+        self._last = now
+        if self._file is not None:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._file.flush()
+        return record
+
+    def close(self):
+        for name, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+        self.profiles = {}
+        self.detach()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def start(path=None, profile_dir=None, arrays=None):
+    """Включает замеры: записи шагов в path (JSON lines), профили фаз в profile_dir."""
+    global _recorder
+    stop()
+    _recorder = MetricsRecorder(path, profile_dir, arrays)
+    return _recorder
+
+
+def enabled():
+    return _recorder is not None
+
+
+def attach(arrays):
+    """Считать сменившие владельца клетки карты с массивами arrays (если замеры включены)."""
+    if _recorder is not None:
+        _recorder.attach(arrays)
+
+
+def count(name, n=1):
+    """Увеличивает счётчик name на n (если замеры включены)."""
+    if _recorder is not None:
+        counters = _recorder.counters
+        counters[name] = counters.get(name, 0) + n
+
+
+def phase(name):
+    """Контекст, время которого добавляется к фазе name текущего шага."""
+    if _recorder is None:
+        return _NO_PHASE
+    return _recorder.phase(name)
+
+
+def end_step(step, kind='step'):
+    """Закрывает запись шага step; без включённых замеров ничего не делает."""
+    if _recorder is not None:
+        return _recorder.record(step, kind)
+    return None
+
+
+def stop(step=None):
+    """
+    Выключает замеры. Если после последнего шага что-то накопилось
+    (например, отрисовка и сохранение), пишется запись kind='finish' для шага step.
+    """
+    global _recorder
+    if _recorder is None:
+        return
+    if step is not None and _recorder.pending():
+        _recorder.record(step, 'finish')
+    _recorder.close()
+    _recorder = None
@@ -0,0 +1,137 @@
+import numpy as np
+from continent_generator import TERRAIN_OCEAN, TERRAIN_LAND, NO_ID
+from hexgrid import label_components, orthogonal_edges
+
+
+def _consecutive_pairs(land, coastal, transpose):
+    """
+    Пары соседних по порядку клеток суши в каждой строке (или столбце при transpose).
+    Между клетками пары только океан — это концы максимального океанского отрезка
+    (или две смежные клетки суши, если отрезок пустой). Оставляются пары,
+    у которых обе клетки прибрежные. Возвращает плоские индексы концов.
+    """
+    rows, cols = land.shape
+    if transpose:
+        lines, positions = np.nonzero(land.T)
+        flat = positions * cols + lines
+    else:
+        lines, positions = np.nonzero(land)
+        flat = lines * cols + positions
+    same_line = lines[1:] == lines[:-1]
+    a = flat[:-1][same_line]
+    b = flat[1:][same_line]
+    both_coastal = coastal[a] & coastal[b]
+    return a[both_coastal], b[both_coastal]
+
+
+class OceanRunIndex:
+    """
+    Индекс прямых водных путей между прибрежными клетками.
+    Для каждой строки и каждого столбца хранятся концы максимальных
+    океанских отрезков (клетки суши по обе стороны), поэтому проверка
+    "может ли A достичь B по прямой линии воды" — это поиск среди пар концов.
+    Индекс строится по ландшафту и прибрежным флагам и пересобирается только при их изменении;
+    множества достижимых государств кэшируются до следующей смены владельцев.
+    """
+    def __init__(self, arrays):
+        self.arrays = arrays
+        land = arrays.view('terrain') == TERRAIN_LAND
+        coastal = arrays.coastal
+        row_a, row_b = _consecutive_pairs(land, coastal, transpose=False)
+        col_a, col_b = _consecutive_pairs(land, coastal, transpose=True)
+        self.ends_a = np.concatenate([row_a, col_a])
+        self.ends_b = np.concatenate([row_b, col_b])
+        self.terrain_version = arrays.terrain_version
+        self.coastal_version = arrays.coastal_version
+        self._owner_version = None
+        self._reachable = {}
+
+    def _refresh(self):
+        version = self.arrays.owner_version
+        if version != self._owner_version:
+            owner = self.arrays.owner
+            self._owner_a = owner[self.ends_a]
+            self._owner_b = owner[self.ends_b]
+            self._reachable = {}
+            self._owner_version = version
+
+    def reachable_states(self, state_id):
+        """Множество id государств, чьи прибрежные клетки достижимы из state_id по прямой воде."""
+        self._refresh()
+        reachable = self._reachable.get(state_id)
+        if reachable is None:
+            reachable = set(self._owner_b[self._owner_a == state_id].tolist())
+            reachable.update(self._owner_a[self._owner_b == state_id].tolist())
+            reachable.discard(state_id)
+            reachable.discard(NO_ID)
+            self._reachable[state_id] = reachable
+        return reachable
+
+    def is_reachable(self, a, b):
+        return b in self.reachable_states(a)
+
+
+class WaterBodies:
+    """
+    Таблица водоёмов: связные (по 4 соседям) области клеток океана,
+    размеченные одним проходом по массиву ландшафта. Номера водоёмов идут
+    в порядке их первой клетки при обходе карты по строкам.
+    Для каждого водоёма известны размер, признак океана (касается края карты)
+    и клетки суши на его берегу; для каждой клетки суши — водоёмы, к которым
+    она выходит. Таблица строится по ландшафту и пересобирается при его изменении.
+    """
+    def __init__(self, arrays):
+        rows, cols = arrays.rows, arrays.cols
+        size = rows * cols
+        water = arrays.terrain == TERRAIN_OCEAN
+        u, v = orthogonal_edges(rows, cols)
+        both = water[u] & water[v]
+        labels, _ = label_components(size, u[both], v[both])
+        self.labels = np.full(size, NO_ID, dtype=np.int64)  # номер водоёма клетки или -1
+        _, self.labels[water] = np.unique(labels[water], return_inverse=True)
+        count = int(self.labels.max()) + 1
+        self.size = np.bincount(self.labels[water], minlength=count)
+
+        edge = np.zeros((rows, cols), dtype=bool)
+        edge[[0, -1], :] = True
+        edge[:, [0, -1]] = True
+        self.oceanic = np.zeros(count, dtype=bool)
+        self.oceanic[self.labels[water & edge.ravel()]] = True
+
+        # Пары (клетка суши, водоём) по рёбрам суша–вода, без повторов и по возрастанию клетки
+        shore = water[u] != water[v]
+        u, v = u[shore], v[shore]
+        u_water = water[u]
+        land = np.where(u_water, v, u)
+        bodies = self.labels[np.where(u_water, u, v)]
+        pairs = np.unique(land * max(count, 1) + bodies)
+        land, bodies = np.divmod(pairs, max(count, 1))
+        self.coastal = np.zeros(size, dtype=bool)  # клетки суши, выходящие к воде
+        self.coastal[land] = True
+        self._land = land
+        self._land_bodies = bodies
+
+        # Берег каждого водоёма в формате CSR
+        order = np.argsort(bodies, kind='stable')
+        self._coast = land[order]
+        self._coast_indptr = np.searchsorted(bodies[order], np.arange(count + 1))
+        self.coast_length = np.diff(self._coast_indptr)
+        self.terrain_version = arrays.terrain_version
+
+    def __len__(self):
+        return len(self.size)
+
+    def coast(self, body):
+        """Плоские индексы клеток суши на берегу водоёма body."""
+        return self._coast[self._coast_indptr[body]:self._coast_indptr[body + 1]]
+
+    def coastal_water_ids(self):
+        """Словарь: индекс прибрежной клетки -> список водоёмов, к которым она выходит."""
+        cells, starts = np.unique(self._land, return_index=True)
+        return dict(zip(cells.tolist(), (part.tolist() for part in np.split(self._land_bodies, starts[1:]))))
+
+    def coastal_cells(self, cells):
+        """Прибрежные клетки из cells в исходном порядке."""
+        cells = list(cells)
+        indices = np.fromiter((cell.index for cell in cells), dtype=np.int64, count=len(cells))
+        return [cells[i] for i in np.nonzero(self.coastal[indices])[0].tolist()]
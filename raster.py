@@ -0,0 +1,175 @@
+"""
+Быстрые растровые кадры карты без matplotlib.
+Каждая клетка — квадратный блок block × block пикселей, нечётные строки
+сдвинуты на полблока вправо (как в offset-сетке), строка 0 внизу.
+Кадры пишутся в PNG (zlib из стандартной библиотеки) или собираются
+в анимированный GIF (нужен Pillow).
+"""
+import os
+import struct
+import zlib
+import numpy as np
+from continent_generator import TERRAIN_LAND
+
+OCEAN_RGB = (0xa0, 0xc4, 0xff)
+LAND_RGB = (0xd2, 0xb4, 0x8c)
+
+
+def parse_color(color):
+    """Цвет '#rrggbb' (или любой цвет matplotlib) -> (r, g, b) в 0..255."""
+    if isinstance(color, str) and color.startswith('#') and len(color) == 7:
+        return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+    import matplotlib.colors as mcolors
+    return tuple(int(round(channel * 255)) for channel in mcolors.to_rgb(color))
+
+
+def color_table(palette, size):
+    """
+    Таблица RGB по id владельца длиной size + 1: последняя строка (owner == -1)
+    и владельцы без цвета в палитре — обычная суша.
+    """
+    table = np.empty((size + 1, 3), dtype=np.uint8)
+    table[:] = LAND_RGB
+    for state_id, color in palette.items():
+        if 0 <= state_id < size:
+            table[state_id] = parse_color(color)
+    return table
+
+
+def frame_rgb(terrain, owner, palette, rows, cols, block=4):
+    """Кадр (высота, ширина, 3) uint8 по плоским массивам ландшафта и владельцев."""
+    table = color_table(palette, max(int(owner.max()), 0) + 1)
+    colors = np.empty((rows * cols, 3), dtype=np.uint8)
+    colors[:] = OCEAN_RGB
+    land = terrain == TERRAIN_LAND
+    colors[land] = table[owner[land]]
+    colors = np.repeat(colors.reshape(rows, cols, 3), block, axis=1)
+
+    shift = block // 2
+    image = np.empty((rows, cols * block + shift, 3), dtype=np.uint8)
+    image[:] = OCEAN_RGB
+    image[0::2, :cols * block] = colors[0::2]
+    image[1::2, shift:] = colors[1::2]
+    return np.repeat(image, block, axis=0)[::-1]
+
+
+def world_frame(world, block=4):
+    """Кадр текущего состояния мира."""
+    arrays = world.arrays
+    return frame_rgb(arrays.terrain, arrays.owner, arrays.palette, world.rows, world.cols, block)
+
+
+def _png_chunk(kind, data):
+    chunk = kind + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk) & 0xffffffff)
+
+
+def write_png(path, image, level=6):
+    """Сохраняет RGB-изображение (высота, ширина, 3) uint8 в PNG."""
+    height, width, _ = image.shape
+    # Каждой строке предшествует байт фильтра 0 (без фильтра)
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, width * 3)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(_png_chunk(b'IDAT', zlib.compress(raw.tobytes(), level)))
+        f.write(_png_chunk(b'IEND', b''))
+
+
+def write_gif(path, frames, duration=100):
+    """Собирает анимированный GIF из итератора RGB-кадров (нужен Pillow)."""
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ImportError("Для записи GIF нужен Pillow (pip install Pillow); "
+                          "кадры можно сохранить в PNG, указав каталог") from None
+    images = (Image.fromarray(frame) for frame in frames)
+    first = next(images, None)
+    if first is None:
+        return
+    first.save(path, save_all=True, append_images=images, duration=duration, loop=0)
+
+
+class FrameExporter:
+    """
+    Кадр на каждом every-м шаге симуляции. Для пути *.gif хранится только
+    первый массив владельцев, а дальше — изменения относительно предыдущего
+    кадра (клетки и их новые владельцы) и палитра, если она поменялась;
+    анимация собирается при close(), кадры восстанавливаются по одному.
+    Иначе path — каталог, куда сразу пишутся frame-<шаг>.png.
+    """
+    def __init__(self, world, path, every=1, block=4, duration=100):
+        self.world = world
+        self.path = path
+        self.every = every
+        self.block = block
+        self.duration = duration
+        self.gif = path.lower().endswith('.gif')
+        self._base = None      # владельцы на первом кадре
+        self._owner = None     # владельцы на последнем кадре
+        self._palette = None   # палитра последнего кадра
+        self._deltas = []      # (клетки, новые владельцы, палитра или None) на кадр
+        if not self.gif:
+            os.makedirs(path, exist_ok=True)
+
+    def capture(self, world=None):
+        world = world if world is not None else self.world
+        step = getattr(world, 'step', 0)
+        if self.every > 1 and step % self.every:
+            return
+        if not self.gif:
+            write_png(os.path.join(self.path, f"frame-{step:06d}.png"), world_frame(world, self.block))
+            return
+        owner = world.arrays.owner
+        if self._owner is None:
+            self._base = owner.copy()
+            self._owner = owner.copy()
+            changed = np.zeros(0, dtype=np.int64)
+        else:
+            changed = np.nonzero(owner != self._owner)[0]
+            self._owner[changed] = owner[changed]
+        palette = world.arrays.palette
+        if palette != self._palette:
+            self._palette = dict(palette)
+            palette = self._palette
+        else:
+            palette = None
+        self._deltas.append((changed.astype(np.int32), owner[changed].copy(), palette))
+
+    def _frames(self):
+        arrays = self.world.arrays
+        owner = self._base.copy()
+        palette = None
+        for changed, values, frame_palette in self._deltas:
+            owner[changed] = values
+            if frame_palette is not None:
+                palette = frame_palette
+            yield frame_rgb(arrays.terrain, owner, palette, self.world.rows, self.world.cols, self.block)
+
+    def close(self):
+        if self.gif and self._deltas:
+            write_gif(self.path, self._frames(), self.duration)
+            self._base = self._owner = self._palette = None
+            self._deltas = []
+
+
+def export_journal(journal_path, world, path, steps=None, block=4, duration=100):
+    """
+    Кадры по журналу территорий (journal.JournalReader) на ландшафте мира world.
+    Цвета берутся из текущей палитры мира. path — *.gif или каталог для PNG.
+    """
+    from journal import JournalReader
+    reader = JournalReader(journal_path)
+    if steps is None:
+        steps = range(min(reader.keyframe_steps()), reader.last_step() + 1)
+    steps = list(steps)
+    arrays = world.arrays
+    frames = (frame_rgb(arrays.terrain, owner.ravel(), arrays.palette, world.rows, world.cols, block)
+              for owner in reader.frames(steps))
+    if path.lower().endswith('.gif'):
+        write_gif(path, frames, duration)
+        return
+    os.makedirs(path, exist_ok=True)
+    for step, frame in zip(steps, frames):
+        write_png(os.path.join(path, f"frame-{step:06d}.png"), frame)
@@ -1,7 +1,8 @@
 import random
-import numpy as np
-from states import State, STATE_NAMES, CONTRAST_COLORS
+from states import State, CellSet, STATE_NAMES, CONTRAST_COLORS
 from ideology import get_ideology_zone
+from territory import select_capital
+import metrics
 
 class StateRegistry:
     def __init__(self):
@@ -23,23 +24,8 @@ class StateRegistry:
             self.next_id = state_id + 1
 
 
-def get_hex_neighbors(cell, grid):
-    r = cell.r
-    q = cell.q
-    neighbors = []
-    if r % 2 == 0:
-        offsets = [(-1, -1), (-1, 0), (0, -1), (0, 1), (1, -1), (1, 0)]
-    else:
-        offsets = [(-1, 0), (-1, 1), (0, -1), (0, 1), (1, 0), (1, 1)]
-    for dr, dq in offsets:
-        nr = r + dr
-        nq = q + dq
-        if 0 <= nr < len(grid) and 0 <= nq < len(grid[0]):
-            neighbors.append(grid[nr][nq])
-    return neighbors
-
 def is_border(cell, parent_state, grid):
-    for neighbor in get_hex_neighbors(cell, grid):
+    for neighbor in cell.hex_neighbors():
         if neighbor is None or neighbor.state_id != parent_state.id:
             return True
     return False
@@ -56,36 +42,13 @@ def get_contiguous_cluster(start_cell, parent_state, grid, cluster_size=5):
             cluster.append(cell)
         if len(cluster) >= cluster_size:
             break
-        for neighbor in get_hex_neighbors(cell, grid):
+        for neighbor in cell.hex_neighbors():
             if neighbor in parent_state.cells and neighbor not in visited and neighbor != parent_state.capital:
                 visited.add(neighbor)
                 queue.append(neighbor)
+    metrics.count('bfs_nodes', len(visited))
     return cluster
 
-def select_capital_for_state(state, grid):
-    """
-    Выбирает столицу для данного государства.
-    Расчитывается центр масс территории (с использованием координат клетки в offset-системе),
-    затем выбирается та клетка (среди внутренних, если они есть), которая минимально удалена от центра.
-    Флаг is_capital клетки устанавливается в True.
-    """
-    # Функция для вычисления позиции клетки на карте.
-    def cell_position(cell):
-        x = np.sqrt(3) * (cell.q + 0.5 * (cell.r % 2))
-        y = 1.5 * cell.r
-        return np.array([x, y])
-    positions = [cell_position(cell) for cell in state.cells]
-    centroid = sum(positions) / len(positions)
-    # Определяем внутренние (не пограничные) клетки
-    interior = [cell for cell in state.cells if not is_border(cell, state, grid)]
-    candidates = interior if interior else state.cells
-    def dist(cell):
-        pos = cell_position(cell)
-        return np.linalg.norm(pos - centroid)
-    capital = min(candidates, key=dist)
-    capital.is_capital = True
-    return capital
-
 def initialize_state_registry(hex_map):
     """
     Если у карты еще нет реестра госид, создает его.
@@ -108,6 +71,7 @@ def trigger_separatism(parent_state, hex_map, current_step):
     initialize_state_registry(hex_map)
     
     # Исключаем столицу из пограничных клеток.
+    metrics.count('cells_scanned', len(parent_state.cells))
     border_cells = [cell for cell in parent_state.cells
                     if is_border(cell, parent_state, grid) and cell != parent_state.capital]
     if not border_cells:
@@ -121,12 +85,11 @@ def trigger_separatism(parent_state, hex_map, current_step):
 
     # Убираем выбранные клетки из территории родительского государства.
     for cell in cluster:
-        if cell in parent_state.cells:
-            parent_state.cells.remove(cell)
+        parent_state.cells.discard(cell)
     
-    # Проверка окружения столицы:
-    capital_neighbors = get_hex_neighbors(parent_state.capital, grid)
-    if not any(neighbor.state_id == parent_state.id for neighbor in capital_neighbors):
+    # Проверка окружения столицы (у сепаратистских образований столицы нет):
+    if parent_state.capital is not None and not any(
+            neighbor.state_id == parent_state.id for neighbor in parent_state.capital.hex_neighbors()):
         print(f"Окружение столицы: {parent_state.name} прекращает существование, оставшиеся территории переходят к сепаратистскому образованию.")
         full_cluster = cluster.copy() + list(parent_state.cells)
         parent_state.cells.clear()
@@ -162,7 +125,7 @@ def trigger_separatism(parent_state, hex_map, current_step):
         new_state.parent_id = parent_state.id
         new_state.birth_step = current_step
         new_state.separatist_timer = 5
-        new_state.cells = full_cluster.copy()
+        new_state.cells = CellSet(full_cluster)
         for cell in new_state.cells:
             cell.state_id = new_state.id
             cell.state_color = new_state.color
@@ -202,7 +165,7 @@ def trigger_separatism(parent_state, hex_map, current_step):
     new_state.parent_id = parent_state.id
     new_state.birth_step = current_step
     new_state.separatist_timer = 5
-    new_state.cells = cluster.copy()
+    new_state.cells = CellSet(cluster)
     for cell in new_state.cells:
         cell.state_id = new_state.id
         cell.state_color = new_state.color
@@ -226,14 +189,14 @@ def process_separatist_states(hex_map, current_step):
                     available_names = [name for name in STATE_NAMES if name not in used_names]
                     state.name = random.choice(available_names) if available_names else f"State_{len(hex_map.states)+1}"
                     # Назначаем новую столицу.
-                    state.capital = select_capital_for_state(state, hex_map.grid)
+                    state.capital = select_capital(hex_map.arrays, state, hex_map.centroids)
                     state.color = random.choice(CONTRAST_COLORS)
                     for cell in state.cells:
                         cell.state_color = state.color
                     print(f"Государство {state.name} получило независимость!")
                 else:
                     # Сепаратист подавлен – возвращаем клетки родительскому государству.
-                    parent = next((s for s in hex_map.states if s.id == state.parent_id), None)
+                    parent = hex_map.states.get(state.parent_id)
                     if parent:
                         for cell in state.cells:
                             cell.state_id = parent.id
@@ -243,29 +206,3 @@ def process_separatist_states(hex_map, current_step):
                     states_to_remove.append(state)
     for s in states_to_remove:
         hex_map.states.remove(s)
-
-def select_capital_for_state(state, grid):
-    """
-    Выбирает столицу для данного государства, используя гекс-сетку.
-    Рассчитывается центр масс территории, затем выбирается клетка, которая минимально удалена от центра.
-    Устанавливается флаг is_capital.
-    """
-    def cell_position(cell):
-        x = np.sqrt(3) * (cell.q + 0.5 * (cell.r % 2))
-        y = 1.5 * cell.r
-        return np.array([x, y])
-    positions = [cell_position(cell) for cell in state.cells]
-    centroid = sum(positions) / len(positions)
-    # Определяем внутренние клетки (не пограничные).
-    def is_border_cell(cell):
-        for neighbor in get_hex_neighbors(cell, grid):
-            if neighbor is None or neighbor.state_id != state.id:
-                return True
-        return False
-    interior_cells = [cell for cell in state.cells if not is_border_cell(cell)]
-    candidates = interior_cells if interior_cells else state.cells
-    def dist(cell):
-        return np.linalg.norm(cell_position(cell) - centroid)
-    capital = min(candidates, key=dist)
-    capital.is_capital = True
-    return capital
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""
+Компактный двоичный снимок мира (.npz) вместо pickle всего графа объектов.
+
+Снимок состоит из плоских массивов:
+  grid_*     – клетки карты (ландшафт, владелец, водоём, флаги);
+  coastal_*  – водоёмы побережья в формате CSR;
+  states_*   – таблица государств, по столбцу на атрибут;
+  history_*  – история государств в столбцах (строки сгруппированы по государствам);
+  unions_*   – унии и их участники;
+  meta       – версия формата, размеры карты, шаг и реестр id.
+Массивы сетки сохраняются без сжатия, поэтому при загрузке с mmap=True
+они отображаются прямо из файла (копирование при записи) и мир
+поднимается без чтения всей карты в память.
+"""
+import sys
+import zipfile
+import numpy as np
+from continent_generator import Map, GridArrays, NO_ID
+from states import State, StateList, CellSet
+
+SNAPSHOT_VERSION = 1
+
+GRID_FIELDS = ('terrain', 'owner', 'water_body', 'oceanic', 'coastal', 'capital')
+# Целочисленные атрибуты государства, которые могут быть None
+NULLABLE_FIELDS = ('ideology_x', 'ideology_y', 'parent_id', 'birth_step', 'separatist_timer', 'union_id')
+HISTORY_INT_FIELDS = ('step', 'power', 'ideology_x', 'ideology_y', 'stability')
+HISTORY_STR_FIELDS = ('name', 'zone')
+
+
+def _csr(groups, dtype=np.int64):
+    """Список последовательностей -> (indptr, values)."""
+    indptr = np.zeros(len(groups) + 1, dtype=np.int64)
+    np.cumsum([len(group) for group in groups], out=indptr[1:])
+    values = np.fromiter((item for group in groups for item in group), dtype=dtype, count=int(indptr[-1]))
+    return indptr, values
+
+
+def _split(indptr, values):
+    """Обратное к _csr: список Python-списков."""
+    values = values.tolist()
+    bounds = indptr.tolist()
+    return [values[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+
+def _nullable(values):
+    """Столбец с None -> (значения, маска заданных)."""
+    present = np.array([value is not None for value in values], dtype=bool)
+    data = np.array([NO_ID if value is None else value for value in values], dtype=np.int64)
+    return data, present
+
+
+def _strings(values):
+    return np.array(['' if value is None else str(value) for value in values], dtype=str)
+
+
+def save_snapshot(world, path, compress=False):
+    """Сохраняет мир в снимок .npz. compress=True уменьшает файл, но отключает mmap-загрузку."""
+    arrays = world.arrays
+    states = list(getattr(world, 'states', ()))
+    data = {}
+
+    for name in GRID_FIELDS:
+        data['grid_' + name] = getattr(arrays, name)
+
+    coastal = sorted(arrays.coastal_water_ids.items())
+    data['coastal_cells'] = np.array([index for index, _ in coastal], dtype=np.int64)
+    data['coastal_indptr'], data['coastal_water_ids'] = _csr([ids for _, ids in coastal])
+
+    palette = sorted(arrays.palette.items())
+    data['palette_ids'] = np.array([state_id for state_id, _ in palette], dtype=np.int64)
+    data['palette_colors'] = _strings([color for _, color in palette])
+
+    data['states_id'] = np.array([state.id for state in states], dtype=np.int64)
+    data['states_name'] = _strings([state.name for state in states])
+    data['states_color'] = _strings([state.color for state in states])
+    data['states_zone'] = _strings([state.ideology_zone for state in states])
+    data['states_zone_set'] = np.array([state.ideology_zone is not None for state in states], dtype=bool)
+    data['states_power'] = np.array([state.power for state in states], dtype=np.int64)
+    data['states_stability'] = np.array([state.stability for state in states], dtype=np.int64)
+    data['states_separatist'] = np.array([state.is_separatist for state in states], dtype=bool)
+    data['states_capital'] = np.array([NO_ID if state.capital is None else state.capital.index
+                                       for state in states], dtype=np.int64)
+    for name in NULLABLE_FIELDS:
+        data['states_' + name], data['states_' + name + '_set'] = _nullable(
+            [getattr(state, name, None) for state in states])
+    data['states_cells_indptr'], data['states_cells'] = _csr(
+        [[cell.index for cell in state.cells] for state in states])
+
+    histories = [getattr(state, 'history', []) for state in states]
+    data['history_indptr'] = np.zeros(len(histories) + 1, dtype=np.int64)
+    np.cumsum([len(history) for history in histories], out=data['history_indptr'][1:])
+    entries = [entry for history in histories for entry in history]
+    for name in HISTORY_INT_FIELDS:
+        data['history_' + name] = np.array([entry[name] for entry in entries], dtype=np.int64)
+    for name in HISTORY_STR_FIELDS:
+        data['history_' + name] = _strings([entry[name] for entry in entries])
+
+    unions = getattr(world, 'unions', None) or []
+    data['unions_id'] = np.array([union.union_id for union in unions], dtype=np.int64)
+    data['unions_name'] = _strings([union.name for union in unions])
+    data['unions_members_indptr'], data['unions_members'] = _csr(
+        [[member.id for member in union.members] for union in unions])
+
+    registry = getattr(world, 'state_registry', None)
+    data['meta'] = np.array([SNAPSHOT_VERSION, world.rows, world.cols, world.num_continents,
+                             getattr(world, 'step', 0),
+                             -1 if registry is None else registry.next_id], dtype=np.int64)
+    data['registry_ids'] = np.array(sorted(registry.assigned_ids) if registry is not None else [],
+                                    dtype=np.int64)
+    data['has_states'] = np.array(hasattr(world, 'states'))
+    data['has_unions'] = np.array(hasattr(world, 'unions'))
+
+    with open(path, 'wb') as f:
+        (np.savez_compressed if compress else np.savez)(f, **data)
+
+
+def _mmap_members(path, names):
+    """
+    Отображает несжатые члены .npz в память (копирование при записи).
+    Возвращает словарь имя -> np.memmap только для тех членов, которые это позволяют.
+    """
+    mapped = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for name in names:
+            try:
+                info = archive.getinfo(name + '.npy')
+            except KeyError:
+                continue
+            if info.compress_type != zipfile.ZIP_STORED:
+                continue
+            # Локальный заголовок zip: 30 байт + имя + дополнительное поле
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = np.frombuffer(f.read(4), dtype='<u2').tolist()
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject or not shape or 0 in shape:
+                continue
+            mapped[name] = np.memmap(path, dtype=dtype, mode='c', offset=f.tell(),
+                                     shape=shape, order='F' if fortran_order else 'C')
+    return mapped
+
+
+def load_snapshot(path, mmap=False):
+    """
+    Загружает мир из снимка. При mmap=True массивы сетки не читаются целиком,
+    а отображаются из файла; изменения остаются в памяти процесса.
+    """
+    from separatism import StateRegistry
+
+    mapped = _mmap_members(path, ['grid_' + name for name in GRID_FIELDS]) if mmap else {}
+    with np.load(path) as npz:
+        version, rows, cols, num_continents, step, next_id = npz['meta'].tolist()
+        if version > SNAPSHOT_VERSION:
+            raise ValueError(f"Снимок версии {version} новее поддерживаемой ({SNAPSHOT_VERSION})")
+        data = {name: npz[name] for name in npz.files if name not in mapped}
+    data.update(mapped)
+
+    arrays = GridArrays(rows, cols)
+    for name in GRID_FIELDS:
+        setattr(arrays, name, data['grid_' + name])
+    coastal = _split(data['coastal_indptr'], data['coastal_water_ids'])
+    arrays.coastal_water_ids = dict(zip(data['coastal_cells'].tolist(), coastal))
+    arrays.palette = dict(zip(data['palette_ids'].tolist(), data['palette_colors'].tolist()))
+    world = Map.from_arrays(arrays, num_continents)
+    world.step = step
+
+    if data['has_states']:
+        cells = arrays.cells
+        columns = {name: data['states_' + name].tolist() for name in
+                   ('id', 'name', 'color', 'zone', 'zone_set', 'power', 'stability', 'separatist', 'capital')}
+        nullable = {name: [value if present else None for value, present in
+                           zip(data['states_' + name].tolist(), data['states_' + name + '_set'].tolist())]
+                    for name in NULLABLE_FIELDS}
+        state_cells = _split(data['states_cells_indptr'], data['states_cells'])
+        history_indptr = data['history_indptr'].tolist()
+        history = {name: data['history_' + name].tolist() for name in HISTORY_INT_FIELDS + HISTORY_STR_FIELDS}
+
+        states = []
+        for i, state_id in enumerate(columns['id']):
+            # Без State.__init__: он тратит случайные числа на силу
+            state = State.__new__(State)
+            state.id = state_id
+            state.color = columns['color'][i]
+            state.name = columns['name'][i]
+            state.cells = CellSet(cells[index] for index in state_cells[i])
+            capital = columns['capital'][i]
+            state.capital = None if capital == NO_ID else cells[capital]
+            state.power = columns['power'][i]
+            state.ideology_x = nullable['ideology_x'][i]
+            state.ideology_y = nullable['ideology_y'][i]
+            state.ideology_zone = columns['zone'][i] if columns['zone_set'][i] else None
+            state.stability = columns['stability'][i]
+            state.is_separatist = columns['separatist'][i]
+            state.parent_id = nullable['parent_id'][i]
+            state.birth_step = nullable['birth_step'][i]
+            state.separatist_timer = nullable['separatist_timer'][i]
+            if nullable['union_id'][i] is not None:
+                state.union_id = nullable['union_id'][i]
+            state.history = [
+                {'step': history['step'][j], 'id': state_id, 'name': history['name'][j],
+                 'power': history['power'][j], 'ideology_x': history['ideology_x'][j],
+                 'ideology_y': history['ideology_y'][j], 'zone': history['zone'][j],
+                 'stability': history['stability'][j]}
+                for j in range(history_indptr[i], history_indptr[i + 1])]
+            states.append(state)
+        world.states = StateList(states)
+
+    if data['has_unions']:
+        from union import Union
+        members = _split(data['unions_members_indptr'], data['unions_members'])
+        world.unions = [
+            Union(union_id, name, [world.states.get(member) for member in ids if world.states.get(member)])
+            for union_id, name, ids in zip(data['unions_id'].tolist(), data['unions_name'].tolist(), members)]
+
+    if next_id >= 0:
+        registry = world.state_registry = StateRegistry()
+        registry.next_id = next_id
+        registry.assigned_ids = set(data['registry_ids'].tolist())
+    return world
+
+
+def convert_pickle(pickle_path, snapshot_path, compress=False):
+    """Переводит старое сохранение saved_map.pkl в снимок .npz."""
+    from engine import load_world
+    world = load_world(pickle_path)
+    save_snapshot(world, snapshot_path, compress=compress)
+    return world
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Использование: python snapshot.py saved_map.pkl saved_map.npz")
+        sys.exit(1)
+    convert_pickle(sys.argv[1], sys.argv[2])
+    print(f"Сохранение {sys.argv[1]} преобразовано в {sys.argv[2]}.")
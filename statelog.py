@@ -0,0 +1,87 @@
+"""
+Журнал показателей государств по шагам (state_log).
+Каждая строка пишется один раз — в тот шаг, когда она появилась в истории
+государства, поэтому в журнал попадают и государства, исчезнувшие позже
+в том же шаге. Запись буферизуется; кроме CSV поддерживается столбцовый
+двоичный формат: куски .npz с массивами за несколько шагов.
+"""
+import os
+import csv
+import glob
+import numpy as np
+
+LOG_FIELDS = ['step', 'id', 'name', 'power', 'ideology_x', 'ideology_y', 'zone', 'stability']
+LOG_INT_FIELDS = ('step', 'id', 'power', 'ideology_x', 'ideology_y', 'stability')
+LOG_STR_FIELDS = ('name', 'zone')
+
+
+class CsvStateLog:
+    """Дописывает строки в CSV-файл пачками по buffer_rows."""
+    def __init__(self, path, buffer_rows=10000):
+        self.path = path
+        self.buffer_rows = buffer_rows
+        self._rows = []
+        self._header = not os.path.exists(path)
+
+    def write(self, rows):
+        self._rows.extend(rows)
+        if len(self._rows) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._rows and not self._header:
+            return
+        with open(self.path, "a", newline='', encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=LOG_FIELDS)
+            if self._header:
+                writer.writeheader()
+                self._header = False
+            writer.writerows(self._rows)
+        self._rows = []
+
+    def close(self):
+        self.flush()
+
+
+class ColumnarStateLog:
+    """
+    Пишет строки в каталог directory кусками chunk-<первый шаг>-<последний шаг>.npz,
+    в каждом — столбцы LOG_FIELDS за chunk_steps шагов.
+    """
+    def __init__(self, directory, chunk_steps=1000):
+        self.directory = directory
+        self.chunk_steps = chunk_steps
+        self._rows = []
+        self._steps = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, rows):
+        self._rows.extend(rows)
+        self._steps += 1
+        if self._steps >= self.chunk_steps:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        rows = self._rows
+        columns = {name: np.array([row[name] for row in rows], dtype=np.int64) for name in LOG_INT_FIELDS}
+        columns.update({name: np.array([row[name] for row in rows], dtype=str) for name in LOG_STR_FIELDS})
+        path = os.path.join(self.directory, f"chunk-{rows[0]['step']:09d}-{rows[-1]['step']:09d}.npz")
+        np.savez(path, **columns)
+        self._rows = []
+        self._steps = 0
+
+    def close(self):
+        self.flush()
+
+
+def read_columnar(directory):
+    """Склеивает все куски столбцового журнала: словарь имя столбца -> массив."""
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(directory, 'chunk-*.npz'))):
+        with np.load(path) as npz:
+            chunks.append({name: npz[name] for name in LOG_FIELDS})
+    if not chunks:
+        return {name: np.zeros(0, dtype=np.int64 if name in LOG_INT_FIELDS else str) for name in LOG_FIELDS}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in LOG_FIELDS}
@@ -1,7 +1,9 @@
 import random
 import matplotlib.colors as mcolors
 import numpy as np
-from collections import deque
+from hexgrid import get_adjacency, cell_positions
+from continent_generator import TERRAIN_LAND, NO_ID
+from territory import select_capital
 
 STATE_NAMES = [
     "Герцепезун", "Тимонт", "Арабания", "Эстребия", "Гаталия", "Эстрегалия", "Макеты", "Алусия", "Кация", "Абгалия", 
@@ -29,11 +31,63 @@ CONTRAST_COLORS = [
     "#a6cee3", "#999999", "#66c2a5", "#fc8d62", "#8da0cb", "#e78ac3", "#a6d854", "#ffd92f", "#e5c494", "#b3b3b3"
 ]
 
+class CellSet:
+    """
+    Упорядоченное множество клеток государства.
+    Добавление, удаление и проверка принадлежности выполняются за O(1),
+    обход идёт в порядке добавления клеток (как у прежнего списка).
+    """
+    __slots__ = ('_cells',)
+
+    def __init__(self, cells=()):
+        self._cells = dict.fromkeys(cells)
+
+    def __contains__(self, cell):
+        return cell in self._cells
+
+    def __iter__(self):
+        return iter(self._cells)
+
+    def __len__(self):
+        return len(self._cells)
+
+    def __getitem__(self, index):
+        # Срезы и доступ по номеру требуют копии порядка — O(n)
+        return list(self._cells)[index]
+
+    def __repr__(self):
+        return f"CellSet({len(self._cells)} клеток)"
+
+    def append(self, cell):
+        self._cells[cell] = None
+
+    add = append
+
+    def extend(self, cells):
+        for cell in cells:
+            self._cells[cell] = None
+
+    def remove(self, cell):
+        try:
+            del self._cells[cell]
+        except KeyError:
+            raise ValueError("клетка не принадлежит государству") from None
+
+    def discard(self, cell):
+        self._cells.pop(cell, None)
+
+    def clear(self):
+        self._cells.clear()
+
+    def copy(self):
+        return CellSet(self._cells)
+
+
 class State:
     def __init__(self, id, color, name=None):
         self.id = id
         self.color = color
-        self.cells = []  # клетки, принадлежащие государству
+        self.cells = CellSet()  # клетки, принадлежащие государству
         self.name = name if name is not None else f"Государство {id+1}"
         self.capital = None  # клетка столицы
         self.power = random.randint(80, 120)
@@ -48,13 +102,80 @@ class State:
         self.separatist_timer = None
         self.history = []
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if not isinstance(self.cells, CellSet):
+            # В старых сохранениях клетки хранились списком
+            self.cells = CellSet(self.cells)
+
+class StateList(list):
+    """
+    Список государств карты с поддерживаемым индексом id -> State.
+    Индекс обновляется при любых добавлениях и удалениях, поэтому
+    поиск государства по id через get() выполняется за O(1).
+    """
+    def __init__(self, states=()):
+        super().__init__(states)
+        self._by_id = {state.id: state for state in self}
+
+    def __reduce__(self):
+        return StateList, (list(self),)
+
+    def get(self, state_id, default=None):
+        return self._by_id.get(state_id, default)
+
+    def _forget(self, state):
+        if self._by_id.get(state.id) is state:
+            del self._by_id[state.id]
+
+    def append(self, state):
+        super().append(state)
+        self._by_id[state.id] = state
+
+    def insert(self, index, state):
+        super().insert(index, state)
+        self._by_id[state.id] = state
+
+    def extend(self, states):
+        states = list(states)
+        super().extend(states)
+        for state in states:
+            self._by_id[state.id] = state
+
+    def __iadd__(self, states):
+        self.extend(states)
+        return self
+
+    def remove(self, state):
+        super().remove(state)
+        self._forget(state)
+
+    def pop(self, index=-1):
+        state = super().pop(index)
+        self._forget(state)
+        return state
+
+    def clear(self):
+        super().clear()
+        self._by_id.clear()
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._by_id = {state.id: state for state in self}
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._by_id = {state.id: state for state in self}
+
+
 class Map:
     def __init__(self, rows, cols, num_continents=25):
         self.rows = rows
         self.cols = cols
         self.num_continents = num_continents
         self.grid = [[None for q in range(cols)] for r in range(rows)]
-        self.states = []
+        self.arrays = None  # GridArrays карты, на клетки которой смотрит grid
+        self.states = StateList()
  
     def get_all_cells(self):
         return [cell for row in self.grid for cell in row]
@@ -68,31 +189,18 @@ class Map:
         return neighbors
 
     def get_hex_neighbors(self, r, q):
-        if r % 2 == 0:
-            offsets = [(-1, -1), (-1, 0), (0, -1), (0, 1), (1, -1), (1, 0)]
-        else:
-            offsets = [(-1, 0), (-1, 1), (0, -1), (0, 1), (1, 0), (1, 1)]
-        neighbors = []
-        for dr, dq in offsets:
-            nr, nq = r + dr, q + dq
-            if 0 <= nr < self.rows and 0 <= nq < self.cols:
-                neighbors.append((nr, nq))
-        return neighbors
+        return get_adjacency(self.rows, self.cols).neighbor_coords(r, q)
 
-    def cell_position(self, cell):
-        x = np.sqrt(3) * (cell.q + 0.5 * (cell.r % 2))
-        y = 1.5 * cell.r
-        return x, y
-
-    def state_centroid(self, state):
-        positions = [self.cell_position(cell) for cell in state.cells]
-        centroid_x = sum(x for x, y in positions) / len(positions)
-        centroid_y = sum(y for x, y in positions) / len(positions)
-        return centroid_x, centroid_y
+    def cell_positions(self, indices):
+        """Координаты центров клеток по плоским индексам: массивы x, y."""
+        return cell_positions(indices, self.cols)
 
     def generate_states(self, count):
+        arrays = self.arrays
+        size = self.rows * self.cols
         # Собираем все сушевые клетки
-        all_land_cells = [cell for row in self.grid for cell in row if cell and cell.terrain == 'land']
+        land = arrays.terrain == TERRAIN_LAND
+        all_land_cells = np.nonzero(land)[0].tolist()
         random.shuffle(all_land_cells)
         start_cells = all_land_cells[:count]
 
@@ -103,57 +211,62 @@ class Map:
         colors = list(CONTRAST_COLORS)
         random.shuffle(colors)
 
-        for i, start_cell in enumerate(start_cells):
+        for i in range(len(start_cells)):
             name = names.pop() if names else f"Государство {i+1}"
             state = State(i, colors[i % len(colors)], name=name)
             # Случайная сила уже установлена в конструкторе
-            state.cells.append(start_cell)
-            start_cell.state_id = state.id
-            start_cell.state_color = state.color
+            arrays.palette[state.id] = state.color
             self.states.append(state)
 
-        # Расширяем территории
-        from collections import deque
-        queue = deque(start_cells)
-        while queue:
-            current = queue.popleft()
-            state_id = current.state_id
-            for neighbor in self.get_neighbors(current.r, current.q):
-                if neighbor.state_id is None and neighbor.terrain == 'land':
-                    neighbor.state_id = state_id
-                    neighbor.state_color = self.states[state_id].color
-                    self.states[state_id].cells.append(neighbor)
-                    queue.append(neighbor)
-
-        # Привязываем оставшиеся не назначенные клетки к ближайшему государству
-        for row in self.grid:
-            for cell in row:
-                if cell and cell.terrain == 'land' and cell.state_id is None:
-                    best_state = min(self.states, key=lambda state: np.hypot(*(np.array(self.cell_position(cell)) - np.array(self.state_centroid(state)))))
-                    cell.state_id = best_state.id
-                    cell.state_color = best_state.color
-                    best_state.cells.append(cell)
+        # Расширяем территории поиском в ширину сразу от всех стартовых клеток.
+        # Волна обрабатывается целиком: соседи перечисляются в порядке очереди
+        # (клетка волны, затем направление), и спорная клетка достаётся первому
+        # в этом порядке — так же, как при обходе очередью по одной клетке.
+        owner = np.full(size, NO_ID, dtype=np.int64)
+        owner[start_cells] = np.arange(len(start_cells))
+        frontier = np.array(start_cells, dtype=np.int64)
+        waves = [frontier]
+        steps = np.array([(-1, 0), (1, 0), (0, -1), (0, 1)])
+        while len(frontier):
+            nr = frontier[:, None] // self.cols + steps[:, 0]
+            nq = frontier[:, None] % self.cols + steps[:, 1]
+            inside = (nr >= 0) & (nr < self.rows) & (nq >= 0) & (nq < self.cols)
+            neighbors = (nr * self.cols + nq)[inside]
+            parents = np.broadcast_to(owner[frontier][:, None], inside.shape)[inside]
+            free = land[neighbors] & (owner[neighbors] == NO_ID)
+            neighbors, parents = neighbors[free], parents[free]
+            _, first = np.unique(neighbors, return_index=True)
+            first.sort()
+            frontier = neighbors[first]
+            owner[frontier] = parents[first]
+            waves.append(frontier)
+
+        # Оставшиеся сушевые клетки (например, на континентах без стартовой клетки)
+        # привязываем к государству с ближайшим центром; центры считаются один раз.
+        leftover = np.nonzero(land & (owner == NO_ID))[0]
+        if len(leftover) and len(start_cells):
+            x, y = self.cell_positions(np.arange(size))
+            owned = owner >= 0
+            counts = np.bincount(owner[owned], minlength=len(start_cells))
+            centroid_x = np.bincount(owner[owned], weights=x[owned], minlength=len(start_cells)) / counts
+            centroid_y = np.bincount(owner[owned], weights=y[owned], minlength=len(start_cells)) / counts
+            # Матрица расстояний строится кусками, чтобы не держать leftover × states целиком
+            chunk = max(1, 4_000_000 // len(start_cells))
+            for start in range(0, len(leftover), chunk):
+                cells = leftover[start:start + chunk]
+                dx = x[cells][:, None] - centroid_x[None, :]
+                dy = y[cells][:, None] - centroid_y[None, :]
+                owner[cells] = np.argmin(np.hypot(dx, dy), axis=1)
+            waves.append(leftover)
+
+        # Клетки государства идут в порядке присоединения
+        order = np.concatenate(waves) if waves else np.zeros(0, dtype=np.int64)
+        arrays.set_owners(order, owner[order])
+        order = order[np.argsort(owner[order], kind='stable')]
+        bounds = np.searchsorted(owner[order], np.arange(len(start_cells) + 1))
+        cells = arrays.cells
+        for state in self.states:
+            state.cells.extend(cells[index] for index in order[bounds[state.id]:bounds[state.id + 1]].tolist())
 
         for state in self.states:
-            state.capital = self.select_capital(state)
-
-    def is_border_cell(self, cell, state):
-        neighbors = self.get_hex_neighbors(cell.r, cell.q)
-        for nr, nq in neighbors:
-            neighbor = self.grid[nr][nq]
-            if neighbor is None or neighbor.state_id != state.id:
-                return True
-        return False
-
-    def select_capital(self, state):
-        positions = [self.cell_position(cell) for cell in state.cells]
-        centroid_x = sum(x for x, y in positions) / len(positions)
-        centroid_y = sum(y for x, y in positions) / len(positions)
-        interior_cells = [cell for cell in state.cells if not self.is_border_cell(cell, state)]
-        candidates = interior_cells if interior_cells else state.cells
-        def distance(cell):
-            x, y = self.cell_position(cell)
-            return np.hypot(x - centroid_x, y - centroid_y)
-        capital = min(candidates, key=distance)
-        capital.is_capital = True
-        return capital
+            state.capital = select_capital(arrays, state)
@@ -0,0 +1,399 @@
+import heapq
+from collections import deque
+import numpy as np
+from hexgrid import label_components
+import metrics
+
+# Номера направлений HEX_OFFSETS_* в порядке обхода шестиугольника по кругу
+RING_ORDER = (0, 1, 3, 5, 4, 2)
+
+
+class StateBorders:
+    """
+    Граф соседства государств, поддерживаемый инкрементально.
+    Для каждой пары государств хранится число общих рёбер гекс-сетки.
+    Кроме того, для каждой упорядоченной пары (a, b) хранится фронт —
+    множество клеток a, соседствующих с клетками b.
+    Граф строится один раз по массиву владельцев, а затем обновляется
+    за O(k) при смене владельца k клеток (подписка на GridArrays.set_owner).
+    """
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.adjacency = arrays.adjacency
+        self._edges = {}  # state_id -> {id соседа: число общих рёбер}
+        self._front = {}  # (a, b) -> множество клеток a, граничащих с b
+        self._cell_front = {}  # клетка -> (владелец, множество чужих соседей-владельцев)
+        self.rebuild()
+        arrays.owner_listeners.append(self.on_owner_change)
+
+    def rebuild(self):
+        """Полный пересчёт графа по текущему массиву владельцев."""
+        owner = self.arrays.owner
+        table = self.adjacency.table
+        cells, directions = np.nonzero(table >= 0)
+        a = owner[cells]
+        b = owner[table[cells, directions]]
+        border = (a >= 0) & (b >= 0) & (a != b)
+        cells = cells[border]
+        a = a[border].astype(np.int64)
+        b = b[border].astype(np.int64)
+        self._edges = {}
+        self._front = {}
+        self._cell_front = {}
+        if not len(a):
+            return
+        # Каждое ребро встречается в таблице один раз в направлении a -> b
+        base = int(max(a.max(), b.max())) + 1
+        keys, counts = np.unique(a * base + b, return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self._edges.setdefault(key // base, {})[key % base] = count
+        # Фронт: различные пары (клетка, чужой владелец соседа)
+        keys = np.unique(cells * base + b)
+        for cell, other in zip((keys // base).tolist(), (keys % base).tolist()):
+            entry = self._cell_front.get(cell)
+            if entry is None:
+                entry = self._cell_front[cell] = (owner.item(cell), set())
+            entry[1].add(other)
+            self._front.setdefault((entry[0], other), set()).add(cell)
+
+    def _change(self, a, b, delta):
+        for x, y in ((a, b), (b, a)):
+            neighbors = self._edges.setdefault(x, {})
+            count = neighbors.get(y, 0) + delta
+            if count > 0:
+                neighbors[y] = count
+            else:
+                neighbors.pop(y, None)
+                if not neighbors:
+                    del self._edges[x]
+
+    def _refresh_front(self, cell):
+        # Пересчитывает, на каких фронтах стоит клетка, по её текущим соседям
+        owner = self.arrays.owner
+        state_id = owner.item(cell)
+        others = set()
+        if state_id >= 0:
+            for neighbor in self.adjacency.neighbors(cell):
+                other = owner.item(neighbor)
+                if other >= 0 and other != state_id:
+                    others.add(other)
+        entry = self._cell_front.pop(cell, None)
+        if entry is not None:
+            for other in entry[1]:
+                front = self._front[entry[0], other]
+                front.discard(cell)
+                if not front:
+                    del self._front[entry[0], other]
+        if others:
+            self._cell_front[cell] = (state_id, others)
+            for other in others:
+                self._front.setdefault((state_id, other), set()).add(cell)
+
+    def on_owner_change(self, index, old, new):
+        owner = self.arrays.owner
+        neighbors = self.adjacency.neighbors(index)
+        for neighbor in neighbors:
+            other = owner.item(neighbor)
+            if other < 0:
+                continue
+            if old >= 0 and other != old:
+                self._change(old, other, -1)
+            if new >= 0 and other != new:
+                self._change(new, other, 1)
+        self._refresh_front(index)
+        for neighbor in neighbors:
+            self._refresh_front(neighbor)
+
+    def shares_border(self, a, b):
+        """Есть ли у государств a и b (по id) общая сухопутная граница."""
+        return b in self._edges.get(a, ())
+
+    def border_length(self, a, b):
+        """Число общих рёбер между государствами a и b."""
+        return self._edges.get(a, {}).get(b, 0)
+
+    def front(self, a, b):
+        """Множество клеток государства a, граничащих с государством b (только для чтения)."""
+        return self._front.get((a, b), ())
+
+    def neighbors_of(self, a):
+        """Множество id государств, граничащих с государством a."""
+        return set(self._edges.get(a, ()))
+
+
+class EnclaveTracker:
+    """
+    Для каждого государства хранит множество клеток, связанных со столицей.
+    Множество строится поиском от столицы при первом запросе, а затем
+    поддерживается по сменам владельцев только в окрестности переданных клеток:
+      - присоединённая клетка, касающаяся связной области, подтягивает за собой
+        ранее отрезанные клетки владельца;
+      - потеря клетки, чьи соседи того же владельца образуют одну дугу
+        шестиугольника, связности не меняет; иначе множество строится заново
+        при следующем запросе.
+    """
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.adjacency = arrays.adjacency
+        self._connected = {}  # state_id -> (индекс столицы, множество связанных клеток)
+        arrays.owner_listeners.append(self.on_owner_change)
+
+    def _flood(self, state_id, start, connected):
+        owner = self.arrays.owner
+        neighbors = self.adjacency.neighbors
+        before = len(connected)
+        queue = deque(start)
+        while queue:
+            current = queue.popleft()
+            for neighbor in neighbors(current):
+                if neighbor not in connected and owner.item(neighbor) == state_id:
+                    connected.add(neighbor)
+                    queue.append(neighbor)
+        # Через очередь прошли стартовые клетки и все присоединённые
+        metrics.count('bfs_nodes', len(start) + len(connected) - before)
+        return connected
+
+    def _splits_ring(self, index, state_id):
+        owner = self.arrays.owner
+        row = self.adjacency.table[index]
+        flags = [row.item(d) >= 0 and owner.item(row.item(d)) == state_id for d in RING_ORDER]
+        arcs = sum(1 for i in range(6) if flags[i] and not flags[i - 1])
+        return arcs > 1
+
+    def on_owner_change(self, index, old, new):
+        entry = self._connected.get(old)
+        if entry is not None and index in entry[1]:
+            if index == entry[0] or self._splits_ring(index, old):
+                del self._connected[old]
+            else:
+                entry[1].discard(index)
+        entry = self._connected.get(new)
+        if entry is not None:
+            connected = entry[1]
+            if any(neighbor in connected for neighbor in self.adjacency.neighbors(index)):
+                connected.add(index)
+                self._flood(new, [index], connected)
+
+    def connected(self, state):
+        """Индексы клеток государства, связанных со столицей; None, если столицы нет."""
+        if state.capital is None:
+            return None
+        capital = state.capital.index
+        entry = self._connected.get(state.id)
+        if entry is None or entry[0] != capital:
+            entry = self._connected[state.id] = (capital, self._flood(state.id, [capital], {capital}))
+        return entry[1]
+
+    def is_enclave(self, state, cell):
+        """Отрезана ли клетка государства от его столицы (без столицы — все клетки)."""
+        connected = self.connected(state)
+        return connected is None or cell.index not in connected
+
+
+class ComponentTable:
+    """
+    Связные компоненты владения на гекс-сетке, размеченные за один проход.
+    Для каждой компоненты известны владелец, размер, наличие столицы
+    и множество владельцев соседних клеток. Таблица — снимок на момент
+    построения: после смены владельцев её нужно построить заново.
+    """
+    def __init__(self, arrays, states):
+        owner = arrays.owner
+        size = len(owner)
+        u, v = arrays.adjacency.edges()
+        owner_u, owner_v = owner[u], owner[v]
+        same = (owner_u == owner_v) & (owner_u >= 0)
+        labels, _ = label_components(size, u[same], v[same])
+
+        # Нумеруем только компоненты, у которых есть владелец
+        owned = owner >= 0
+        roots, owned_labels = np.unique(labels[owned], return_inverse=True)
+        count = len(roots)
+        self.labels = np.full(size, -1, dtype=np.int64)  # номер компоненты клетки или -1
+        self.labels[owned] = owned_labels
+        self.owner = np.zeros(count, dtype=np.int64)
+        self.owner[owned_labels] = owner[owned]
+        self.size = np.bincount(owned_labels, minlength=count)
+
+        capitals = [state.capital.index for state in states if state.capital is not None]
+        self.has_capital = np.zeros(count, dtype=bool)
+        if capitals:
+            capital_labels = self.labels[capitals]
+            self.has_capital[capital_labels[capital_labels >= 0]] = True
+
+        # Клетки каждой компоненты в порядке обхода сетки (формат CSR)
+        cells = np.nonzero(owned)[0]
+        order = np.argsort(owned_labels, kind='stable')
+        self._cells = cells[order]
+        self._cells_indptr = np.concatenate([[0], np.cumsum(self.size)])
+
+        # Владельцы клеток, соседствующих с компонентой (без ничейных)
+        border = (owner_u != owner_v) & (owner_u >= 0) & (owner_v >= 0)
+        pair_labels = np.concatenate([self.labels[u[border]], self.labels[v[border]]])
+        pair_owners = np.concatenate([owner_v[border], owner_u[border]]).astype(np.int64)
+        base = max(int(owner.max()), 0) + 1
+        pairs = np.unique(pair_labels * base + pair_owners)
+        self._neighbor_owners = pairs % base
+        self._neighbors_indptr = np.searchsorted(pairs // base, np.arange(count + 1))
+
+    def __len__(self):
+        return len(self.size)
+
+    def cells(self, component):
+        """Плоские индексы клеток компоненты."""
+        return self._cells[self._cells_indptr[component]:self._cells_indptr[component + 1]]
+
+    def neighbor_owners(self, component):
+        """id государств, клетки которых граничат с компонентой."""
+        return self._neighbor_owners[self._neighbors_indptr[component]:self._neighbors_indptr[component + 1]]
+
+    def components_of(self, state_id):
+        """Номера компонент, принадлежащих государству."""
+        return np.nonzero(self.owner == state_id)[0]
+
+    def isolated(self, threshold):
+        """Компоненты без столицы размером не больше threshold."""
+        return np.nonzero((self.size <= threshold) & ~self.has_capital)[0]
+
+
+class StateCentroids:
+    """
+    Суммы координат клеток каждого государства, поддерживаемые по сменам владельцев.
+    Хранятся целые суммы (число клеток, сумма 2q + r % 2, сумма r), поэтому
+    центр масс берётся за O(1) и не накапливает ошибок округления.
+    """
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self._sums = {}  # state_id -> [число клеток, сумма 2q + r % 2, сумма r]
+        self.rebuild()
+        arrays.owner_listeners.append(self.on_owner_change)
+
+    def rebuild(self):
+        """Полный пересчёт сумм по текущему массиву владельцев."""
+        owner = self.arrays.owner
+        cells = np.nonzero(owner >= 0)[0]
+        ids = owner[cells].astype(np.int64)
+        r, q = np.divmod(cells, self.arrays.cols)
+        counts = np.bincount(ids)
+        sum_x = np.bincount(ids, weights=2 * q + (r & 1))
+        sum_y = np.bincount(ids, weights=r)
+        self._sums = {state_id: [int(counts[state_id]), int(sum_x[state_id]), int(sum_y[state_id])]
+                      for state_id in np.nonzero(counts)[0].tolist()}
+
+    def on_owner_change(self, index, old, new):
+        r, q = divmod(index, self.arrays.cols)
+        x = 2 * q + (r & 1)
+        if old >= 0:
+            sums = self._sums[old]
+            sums[0] -= 1
+            sums[1] -= x
+            sums[2] -= r
+            if not sums[0]:
+                del self._sums[old]
+        if new >= 0:
+            sums = self._sums.setdefault(new, [0, 0, 0])
+            sums[0] += 1
+            sums[1] += x
+            sums[2] += r
+
+    def sums(self, state_id):
+        """(число клеток, сумма 2q + r % 2, сумма r) территории государства или None."""
+        sums = self._sums.get(state_id)
+        return tuple(sums) if sums is not None else None
+
+    def centroid(self, state_id):
+        """Центр масс территории государства (x, y) или None, если клеток нет."""
+        sums = self._sums.get(state_id)
+        if sums is None:
+            return None
+        count, sum_x, sum_y = sums
+        return np.sqrt(3) / 2 * sum_x / count, 1.5 * sum_y / count
+
+
+def select_capital(arrays, state, centroids=None):
+    """
+    Выбирает столицу государства: из внутренних клеток (все соседи на карте
+    принадлежат ему же), а если таких нет — из всех, берётся ближайшая к центру
+    масс территории; при равенстве — первая в порядке state.cells.
+    centroids – StateCentroids карты; без него центр считается по клеткам.
+    Флаг is_capital клетки устанавливается в True.
+    """
+    cells = np.fromiter((cell.index for cell in state.cells), dtype=np.int64, count=len(state.cells))
+    if not len(cells):
+        return None
+    metrics.count('cells_scanned', len(cells))
+    table = arrays.adjacency.table[cells]
+    neighbor_owner = arrays.owner[np.where(table >= 0, table, 0)]
+    interior = ((table < 0) | (neighbor_owner == state.id)).all(axis=1)
+
+    r, q = np.divmod(cells, arrays.cols)
+    x = 2 * q + (r & 1)  # x центра клетки в единицах sqrt(3) / 2
+    sums = centroids.sums(state.id) if centroids is not None else None
+    if sums is None:
+        sums = len(cells), int(x.sum()), int(r.sum())
+    count, sum_x, sum_y = sums
+    # Квадрат расстояния до центра масс с точностью до множителя 4:
+    # целые координаты клеток не накапливают ошибок, и симметричные клетки равноудалены
+    distance = 3 * (x - sum_x / count) ** 2 + 9 * (r - sum_y / count) ** 2
+    if interior.any():
+        distance[~interior] = np.inf  # внутренние клетки в приоритете
+    capital = arrays.cells[cells[np.argmin(distance)].item()]
+    capital.is_capital = True
+    return capital
+
+
+def plan_capture(hex_map, winner, loser, candidates, priority, count):
+    """
+    Выбирает до count клеток из candidates (клетки loser), которые захватывает winner.
+    Сначала берутся клетки priority (анклавы у его границы), затем фронт —
+    клетки кандидатов, граничащие с территорией победителя (фронт пары
+    хранится в hex_map.borders), — из кучи по гекс-расстоянию до его столицы
+    (без столицы — по номеру клетки). Взятая клетка открывает соседних кандидатов;
+    если фронт иссяк, в кучу добавляются все оставшиеся кандидаты.
+    """
+    neighbors = hex_map.adjacency.neighbors
+    pending = {cell.index: cell for cell in candidates}
+    if winner.capital is not None:
+        # Расстояния в замкнутом виде по кубическим координатам — только для кандидатов
+        indices = np.fromiter(pending, dtype=np.int64, count=len(pending))
+        distance = dict(zip(indices.tolist(),
+                            hex_map.adjacency.distances(winner.capital.index, indices).tolist()))
+        rank = lambda index: (distance[index], index)
+    else:
+        rank = lambda index: (0, index)
+
+    queued = set()
+    heap = []
+
+    def open_neighbors(index):
+        for neighbor in neighbors(index):
+            if neighbor in pending and neighbor not in queued:
+                queued.add(neighbor)
+                heapq.heappush(heap, rank(neighbor))
+
+    selected = []
+    for cell in sorted(priority, key=lambda cell: rank(cell.index)):
+        if len(selected) >= count:
+            break
+        if pending.pop(cell.index, None) is not None:
+            selected.append(cell)
+            open_neighbors(cell.index)
+
+    for index in hex_map.borders.front(loser.id, winner.id):
+        if index in pending and index not in queued:
+            queued.add(index)
+            heap.append(rank(index))
+    heapq.heapify(heap)
+
+    while len(selected) < count and pending:
+        if not heap:
+            heap = [rank(index) for index in pending]
+            queued.update(pending)
+            heapq.heapify(heap)
+        _, index = heapq.heappop(heap)
+        cell = pending.pop(index, None)
+        if cell is None:
+            continue
+        selected.append(cell)
+        open_neighbors(index)
+    return selected
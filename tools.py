@@ -1,3 +1,6 @@
+from journal import change_cause, CAUSE_TRANSFER
+from territory import select_capital
+
 def transfer_cell(hex_map, r, q, new_state_id):
     grid = hex_map.grid
     if not (0 <= r < len(grid)) or not (0 <= q < len(grid[0])):
@@ -5,24 +8,34 @@ def transfer_cell(hex_map, r, q, new_state_id):
         return
 
     cell = grid[r][q]
-    old_state = next((s for s in hex_map.states if s.id == cell.state_id), None)
-    new_state = next((s for s in hex_map.states if s.id == new_state_id), None)
+    old_state = hex_map.states.get(cell.state_id)
+    new_state = hex_map.states.get(new_state_id)
 
     if not new_state:
         print(f"Государство с ID {new_state_id} не найдено.")
         return
 
+    lost_capital = False
     if old_state:
-        if cell in old_state.cells:
-            old_state.cells.remove(cell)
+        old_state.cells.discard(cell)
         # Если это была столица
         if old_state.capital == cell:
             old_state.capital.is_capital = False
             old_state.capital = None
-            print(f"Внимание: клетка была столицей государства {old_state.name} — столица сброшена.")
+            lost_capital = True
 
-    cell.state_id = new_state.id
+    with change_cause(hex_map.arrays, CAUSE_TRANSFER):
+        cell.state_id = new_state.id
     cell.state_color = new_state.color
     new_state.cells.append(cell)
 
+    if lost_capital:
+        # Столица переносится в оставшуюся территорию (центр масс известен по суммам координат)
+        old_state.capital = select_capital(hex_map.arrays, old_state, hex_map.centroids)
+        if old_state.capital is None:
+            print(f"Внимание: клетка была столицей государства {old_state.name} — столица сброшена.")
+        else:
+            print(f"Внимание: клетка была столицей государства {old_state.name} — столица перенесена "
+                  f"в ({old_state.capital.r}, {old_state.capital.q}).")
+
     
\ No newline at end of file
@@ -1,6 +1,8 @@
-import random
 import numpy as np
 from states import STATE_NAMES
+from battle import resolve_battles
+from journal import change_cause, CAUSE_UNION_BATTLE
+import metrics
 
 UNION_NAMES = [
     "Испания", "Ларвентия", "Дигория", "Элгон", "Аравения", "Сабания", "Вебрия", "Аговина",
@@ -20,33 +22,12 @@ class Union:
         self.name = name
         self.members = members  # Список объектов State
 
-def get_hex_neighbors(cell, grid):
-    """Возвращает соседей клетки (гекс-связность) — 6 соседей."""
-    r = cell.r
-    q = cell.q
-    neighbors = []
-    if r % 2 == 0:
-        offsets = [(-1, -1), (-1, 0), (0, -1), (0, 1), (1, -1), (1, 0)]
-    else:
-        offsets = [(-1, 0), (-1, 1), (0, -1), (0, 1), (1, 0), (1, 1)]
-    for dr, dq in offsets:
-        nr = r + dr
-        nq = q + dq
-        if 0 <= nr < len(grid) and 0 <= nq < len(grid[0]):
-            neighbors.append(grid[nr][nq])
-    return neighbors
-
-def have_land_border(state1, state2, grid):
+def have_land_border(state1, state2, hex_map):
     """
     Проверяет, имеют ли два государства общую сухопутную границу.
-    Проходит по всем клеткам одного государства и, используя get_hex_neighbors, 
-    ищет хотя бы одну клетку, соседствующую с клеткой второго государства.
+    Использует граф соседства государств карты (hex_map.borders).
     """
-    for cell in state1.cells:
-        for neighbor in get_hex_neighbors(cell, grid):
-            if neighbor.state_id == state2.id:
-                return True
-    return False
+    return hex_map.borders.shares_border(state1.id, state2.id)
 
 def similar_ideology(state1, state2, get_coalition):
     """
@@ -57,44 +38,124 @@ def similar_ideology(state1, state2, get_coalition):
 def power_difference_within(state1, state2, threshold=10):
     return abs(state1.power - state2.power) <= threshold
 
-def form_unions(hex_map, get_coalition):
+def _coalition(state, get_coalition):
+    return get_coalition(state.ideology_zone) if state.ideology_zone is not None else None
+
+def _is_free(state):
+    # Свободное государство: существует, не сепаратист и не состоит в унии
+    return not state.is_separatist and getattr(state, 'union_id', None) is None
+
+def _largest_connected(members, hex_map):
+    """Наибольшая связная (по сухопутным границам) часть членов унии."""
+    remaining = {member.id: member for member in members}
+    best = []
+    while remaining:
+        start = next(iter(remaining.values()))
+        component = [start]
+        del remaining[start.id]
+        queue = [start]
+        while queue:
+            current = queue.pop()
+            for neighbor_id in hex_map.borders.neighbors_of(current.id):
+                neighbor = remaining.pop(neighbor_id, None)
+                if neighbor is not None:
+                    component.append(neighbor)
+                    queue.append(neighbor)
+        if len(component) > len(best):
+            best = component
+    order = {member.id: index for index, member in enumerate(members)}
+    return sorted(best, key=lambda member: order[member.id])
+
+def _grow(members, coalition, hex_map, get_coalition, union_id):
     """
-    Формирует унии среди независимых государств, удовлетворяющих условиям:
-      - Имеют общую сухопутную границу.
-      - Идеологически совместимы.
-      - Разница сил не превышает 10.
+    Расширяет унию соседями той же коалиции: кандидат присоединяется, если граничит
+    с кем-то из членов, свободен и его сила отличается от средней не больше чем на 10.
+    Рассматриваются только соседи по графу границ, а не все государства карты.
+    """
+    states = hex_map.states
+    power = sum(member.power for member in members)
+    frontier = set()
+    for member in members:
+        frontier.update(hex_map.borders.neighbors_of(member.id))
+    while True:
+        joined = False
+        for candidate_id in sorted(frontier):
+            candidate = states.get(candidate_id)
+            if candidate is None or not _is_free(candidate) or _coalition(candidate, get_coalition) != coalition:
+                continue
+            if abs(candidate.power - power / len(members)) > 10:
+                continue
+            candidate.union_id = union_id
+            members.append(candidate)
+            power += candidate.power
+            frontier.update(hex_map.borders.neighbors_of(candidate_id))
+            joined = True
+        if not joined:
+            return members
+
+def update_unions(hex_map, get_coalition):
+    """
+    Поддерживает унии между шагами вместо построения заново:
+      - члены, исчезнувшие с карты, ставшие сепаратистами или сменившие коалицию,
+        выходят из унии; из распавшейся на части унии остаётся наибольшая связная часть;
+      - унии меньше чем из двух государств распускаются;
+      - оставшиеся унии принимают подходящих соседей (та же коалиция, общая граница,
+        разница с средней силой не больше 10);
+      - свободные государства образуют новые унии по тем же правилам.
     Каждое государство может быть членом только одной унии.
-    Сформированные унии сохраняются в hex_map.unions.
+    Унии сохраняются в hex_map.unions.
     """
+    states = hex_map.states
     unions = []
-    union_id_counter = 0
-    independent_states = [s for s in hex_map.states if not hasattr(s, 'union_id') or s.union_id is None]
-    for state in independent_states:
-        if hasattr(state, 'union_id') and state.union_id is not None:
+    for union in getattr(hex_map, 'unions', None) or []:
+        members = [member for member in union.members
+                   if states.get(member.id) is member and not member.is_separatist]
+        coalitions = [_coalition(member, get_coalition) for member in members]
+        # Самая частая коалиция; при равенстве — та, что раньше встречается среди членов
+        coalition = max(coalitions, key=coalitions.count) if coalitions else None
+        members = [member for member, member_coalition in zip(members, coalitions) if member_coalition == coalition]
+        members = _largest_connected(members, hex_map)
+        kept = {member.id for member in members} if len(members) > 1 else set()
+        for member in union.members:
+            if member.id not in kept and getattr(member, 'union_id', None) == union.union_id:
+                member.union_id = None
+        if kept:
+            union.members = members
+            unions.append(union)
+
+    for union in unions:
+        _grow(union.members, _coalition(union.members[0], get_coalition), hex_map, get_coalition, union.union_id)
+
+    used_names = {union.name for union in unions}
+    next_id = max((union.union_id for union in unions), default=-1) + 1
+    for state in states:
+        if not _is_free(state) or state.ideology_zone is None:
             continue
-        union_members = [state]
-        state.union_id = union_id_counter
-        for other in independent_states:
-            if other.id == state.id:
-                continue
-            if hasattr(other, 'union_id') and other.union_id is not None:
-                continue
-            border_ok = any(have_land_border(member, other, hex_map.grid) for member in union_members)
-            ideology_ok = all(similar_ideology(member, other, get_coalition) for member in union_members)
-            avg_power = sum(member.power for member in union_members) / len(union_members)
-            power_ok = abs(other.power - avg_power) <= 10
-            if border_ok and ideology_ok and power_ok:
-                union_members.append(other)
-                other.union_id = union_id_counter
-        if len(union_members) > 1:
-            available_names = [name for name in UNION_NAMES if name not in [u.name for u in unions]]
-            union_name = available_names[0] if available_names else f"Union_{union_id_counter}"
-            new_union = Union(union_id_counter, union_name, union_members)
-            unions.append(new_union)
-            union_id_counter += 1
+        state.union_id = next_id
+        members = _grow([state], _coalition(state, get_coalition), hex_map, get_coalition, next_id)
+        if len(members) < 2:
+            state.union_id = None
+            continue
+        union_name = next((name for name in UNION_NAMES if name not in used_names), f"Union_{next_id}")
+        used_names.add(union_name)
+        unions.append(Union(next_id, union_name, members))
+        next_id += 1
     hex_map.unions = unions
     return unions
 
+def form_unions(hex_map, get_coalition):
+    """
+    Формирует унии заново среди независимых государств, удовлетворяющих условиям:
+      - Имеют общую сухопутную границу.
+      - Идеологически совместимы.
+      - Разница сил не превышает 10.
+    Сформированные унии сохраняются в hex_map.unions.
+    """
+    for state in hex_map.states:
+        state.union_id = None
+    hex_map.unions = []
+    return update_unions(hex_map, get_coalition)
+
 def simulate_union_battle(hex_map, union, enemy_state, silent=False):
     """
     Симулирует битву между унией и враждебным государством enemy_state.
@@ -105,39 +166,22 @@ def simulate_union_battle(hex_map, union, enemy_state, silent=False):
     Если у проигравшего не получилось покрыть потери, он теряет недостающие клетки.
     Оставшиеся у победителей очки используются для захвата клеток противника.
     """
-    grid = hex_map.grid
-    # Определяем членов унии, имеющих контакт с enemy_state (сухопутно или через побережье)
-    union_members_with_border = []
-    for state in union.members:
-        if have_land_border(state, enemy_state, grid):
-            union_members_with_border.append(state)
-        else:
-            for cell in state.cells:
-                if getattr(cell, 'is_coastal', False):
-                    for neighbor in get_hex_neighbors(cell, grid):
-                        if neighbor.state_id == enemy_state.id:
-                            union_members_with_border.append(state)
-                            break
-                    if state in union_members_with_border:
-                        break
+    # Определяем членов унии, имеющих контакт с enemy_state.
+    # Соседство прибрежной клетки с клеткой врага — это тоже общая граница,
+    # поэтому достаточно графа соседства государств.
+    union_members_with_border = [state for state in union.members
+                                 if have_land_border(state, enemy_state, hex_map)]
     if not union_members_with_border:
         if not silent:
             print("Ни один член унии не имеет связи с врагом. Бой не проводится.")
         return None
 
     # Симулируем индивидуальную битву для каждого участника унии
+    metrics.count('union_battles', len(union_members_with_border))
     battle_results = {}  # state -> очки победы (vp), положительные если выиграл, отрицательные если проиграл
-    for state in union_members_with_border:
-        rounds = random.randint(15, 25)
-        state_score = 0
-        enemy_score = 0
-        for _ in range(rounds):
-            s_roll = random.randint(1, state.power)
-            e_roll = random.randint(1, enemy_state.power)
-            if s_roll > e_roll:
-                state_score += 1
-            elif e_roll > s_roll:
-                enemy_score += 1
+    state_scores, enemy_scores = resolve_battles([state.power for state in union_members_with_border],
+                                                 [enemy_state.power] * len(union_members_with_border))
+    for state, state_score, enemy_score in zip(union_members_with_border, state_scores.tolist(), enemy_scores.tolist()):
         vp = state_score - enemy_score
         battle_results[state] = vp
         if not silent:
@@ -147,48 +191,50 @@ def simulate_union_battle(hex_map, union, enemy_state, silent=False):
     winners = [state for state, vp in battle_results.items() if vp > 0]
     losers = [state for state, vp in battle_results.items() if vp < 0]
 
-    # Для каждого проигравшего пытаемся покрыть потери за счёт победителей
-    for loser in losers:
-        required_cover = abs(battle_results[loser])
-        if winners:
-            contribution_per_winner = required_cover / len(winners)
-            total_contributed = 0
-            for winner in winners:
-                available = battle_results[winner]
-                contribution = min(available, contribution_per_winner)
-                battle_results[winner] -= contribution
-                total_contributed += contribution
-            if total_contributed >= required_cover:
-                if not silent:
-                    print(f"{loser.name}: Потери полностью покрыты союзниками.")
+    # Смены владельцев клеток в журнале помечаются как битва унии
+    with change_cause(hex_map.arrays, CAUSE_UNION_BATTLE):
+        # Для каждого проигравшего пытаемся покрыть потери за счёт победителей
+        for loser in losers:
+            required_cover = abs(battle_results[loser])
+            if winners:
+                contribution_per_winner = required_cover / len(winners)
+                total_contributed = 0
+                for winner in winners:
+                    available = battle_results[winner]
+                    contribution = min(available, contribution_per_winner)
+                    battle_results[winner] -= contribution
+                    total_contributed += contribution
+                if total_contributed >= required_cover:
+                    if not silent:
+                        print(f"{loser.name}: Потери полностью покрыты союзниками.")
+                else:
+                    deficit = required_cover - total_contributed
+                    capture_cells_for_enemy(loser, enemy_state, deficit, hex_map, silent)
+                    if not silent:
+                        print(f"{loser.name}: Потери не покрыты на {deficit} клеток, они теряются.")
             else:
-                deficit = required_cover - total_contributed
-                capture_cells_for_enemy(loser, enemy_state, deficit, grid, silent)
+                capture_cells_for_enemy(loser, enemy_state, required_cover, hex_map, silent)
+                if not silent:
+                    print(f"{loser.name} проиграл без поддержки союзников и теряет {required_cover} клеток.")
+
+        # Победители используют остаток своих очков для захвата клеток у врага
+        total_captured = 0
+        for winner in winners:
+            remaining_vp = battle_results[winner]
+            if remaining_vp > 0:
+                captured = capture_enemy_cells(winner, enemy_state, remaining_vp, hex_map, silent)
+                total_captured += captured
                 if not silent:
-                    print(f"{loser.name}: Потери не покрыты на {deficit} клеток, они теряются.")
-        else:
-            capture_cells_for_enemy(loser, enemy_state, required_cover, grid, silent)
-            if not silent:
-                print(f"{loser.name} проиграл без поддержки союзников и теряет {required_cover} клеток.")
-
-    # Победители используют остаток своих очков для захвата клеток у врага
-    total_captured = 0
-    for winner in winners:
-        remaining_vp = battle_results[winner]
-        if remaining_vp > 0:
-            captured = capture_enemy_cells(winner, enemy_state, remaining_vp, grid, silent)
-            total_captured += captured
-            if not silent:
-                print(f"{winner.name} захватывает {captured} клеток у {enemy_state.name}.")
+                    print(f"{winner.name} захватывает {captured} клеток у {enemy_state.name}.")
     return (battle_results, total_captured)
 
-def capture_cells_for_enemy(loser, enemy_state, num_cells, grid, silent=False):
+def capture_cells_for_enemy(loser, enemy_state, num_cells, hex_map, silent=False):
     """
     Захватывает у проигравшего клетки в количестве num_cells.
-    Кандидаты выбираются среди прибрежных участков (is_coastal) с terrain == 'land'.
+    Кандидаты выбираются среди прибрежных клеток суши (по таблице водоёмов карты).
     Захваченные клетки переходят к enemy_state.
     """
-    candidate_cells = [cell for cell in loser.cells if cell.terrain == 'land' and getattr(cell, 'is_coastal', False)]
+    candidate_cells = hex_map.water_bodies.coastal_cells(loser.cells)
     to_capture = candidate_cells[:min(int(num_cells), len(candidate_cells))]
     for cell in to_capture:
         cell.state_id = enemy_state.id
@@ -198,12 +244,12 @@ def capture_cells_for_enemy(loser, enemy_state, num_cells, grid, silent=False):
     if not silent:
         print(f"{loser.name} теряет {len(to_capture)} клеток, которые захватываются {enemy_state.name}.")
 
-def capture_enemy_cells(winner, enemy_state, num_cells, grid, silent=False):
+def capture_enemy_cells(winner, enemy_state, num_cells, hex_map, silent=False):
     """
     Победитель захватывает клетки у enemy_state в количестве, равном num_cells.
-    Кандидаты выбираются среди прибрежных (is_coastal) клеток с terrain == 'land'.
+    Кандидаты выбираются среди прибрежных клеток суши (по таблице водоёмов карты).
     """
-    candidate_cells = [cell for cell in enemy_state.cells if cell.terrain == 'land' and getattr(cell, 'is_coastal', False)]
+    candidate_cells = hex_map.water_bodies.coastal_cells(enemy_state.cells)
     to_capture = candidate_cells[:min(int(num_cells), len(candidate_cells))]
     for cell in to_capture:
         cell.state_id = winner.id
@@ -1,34 +1,58 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.patches import RegularPolygon, Polygon
-
-def draw_hex_grid(ax, side, cells, rows, cols):
-    for cell in cells:
-        q = cell.q
-        r = cell.r
-        if cell.terrain == 'land':
-            if hasattr(cell, 'state_color'):
-                fill_color = cell.state_color
-            else:
-                fill_color = '#d2b48c'
-        else:
-            fill_color = '#a0c4ff'
-
-        x = side * np.sqrt(3) * (q + 0.5 * (r % 2))
-        y = side * 1.5 * r
-
-        edge_color = fill_color
-
-        hexagon = RegularPolygon(
-            (x, y),
-            numVertices=6,
-            radius=side,
-            orientation=0,
-            edgecolor=edge_color,
-            facecolor=fill_color,
-            linewidth=0.5
-        )
-        ax.add_patch(hexagon)
+import matplotlib.colors as mcolors
+from matplotlib.collections import PolyCollection, LineCollection
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from continent_generator import TERRAIN_LAND
+
+OCEAN_COLOR = '#a0c4ff'
+LAND_COLOR = '#d2b48c'
+# Номер ребра шестиугольника (между вершинами k и k+1, вершина k под углом 30° + 60°·k)
+# для каждого направления соседа HEX_OFFSETS_* — одинаковый для чётных и нечётных строк
+DIRECTION_EDGE = (3, 4, 2, 5, 1, 0)
+
+
+def hex_centers(rows, cols, side):
+    """Центры всех клеток (в порядке плоских индексов): массивы x, y."""
+    r = np.repeat(np.arange(rows), cols)
+    q = np.tile(np.arange(cols), rows)
+    x = side * np.sqrt(3) * (q + 0.5 * (r % 2))
+    y = side * 1.5 * r
+    return x, y
+
+
+def hex_vertices(rows, cols, side):
+    """Вершины шестиугольников всех клеток одним массивом (rows*cols, 6, 2)."""
+    x, y = hex_centers(rows, cols, side)
+    angles = np.pi / 2 + np.arange(6) * np.pi / 3  # вершина сверху, как у RegularPolygon
+    vertices = np.empty((rows * cols, 6, 2))
+    vertices[:, :, 0] = x[:, None] + side * np.cos(angles)
+    vertices[:, :, 1] = y[:, None] + side * np.sin(angles)
+    return vertices
+
+
+def cell_face_colors(arrays):
+    """RGBA-цвет каждой клетки: цвет государства, суша без владельца или вода."""
+    colors = np.empty((len(arrays.terrain), 4))
+    colors[:] = mcolors.to_rgba(OCEAN_COLOR)
+    land = arrays.terrain == TERRAIN_LAND
+    owner = arrays.owner
+    # Таблица цветов по id владельца; владельцы без цвета в палитре — обычная суша
+    table = np.empty((max(int(owner.max()), 0) + 2, 4))
+    table[:] = mcolors.to_rgba(LAND_COLOR)
+    for state_id, color in arrays.palette.items():
+        if 0 <= state_id < len(table) - 1:
+            table[state_id] = mcolors.to_rgba(color)
+    colors[land] = table[owner[land]]  # owner == -1 попадает в последнюю строку
+    return colors
+
+
+def draw_hex_grid(ax, side, hex_map):
+    """Все клетки карты одной коллекцией многоугольников."""
+    rows, cols = hex_map.rows, hex_map.cols
+    colors = cell_face_colors(hex_map.arrays)
+    ax.add_collection(PolyCollection(hex_vertices(rows, cols, side), facecolors=colors,
+                                     edgecolors=colors, linewidths=0.5))
 
     x_max = side * np.sqrt(3) * (cols + 0.5 * ((rows-1) % 2)) + side
     y_max = side * 1.5 * (rows - 1) + side
@@ -37,6 +61,19 @@ def draw_hex_grid(ax, side, cells, rows, cols):
     ax.set_aspect('equal')
     ax.axis('off')
 
+
+def draw_coordinate_labels(ax, side, rows, cols):
+    """Номера строк и столбцов по краям карты — подписями делений осей, а не отдельными текстами."""
+    ax.axis('on')
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    ax.set_yticks(np.arange(rows) * 1.5 * side, [str(r) for r in range(rows)])
+    ax.set_xticks(np.arange(cols) * side * np.sqrt(3) + side * np.sqrt(3) * 0.5, [str(q) for q in range(cols)])
+    ax.tick_params(length=0, labelsize=6, labelcolor='gray',
+                   left=True, right=True, top=True, bottom=True,
+                   labelleft=True, labelright=True, labeltop=True, labelbottom=True)
+
+
 def get_hex_center(cell, side):
     q = cell.q
     r = cell.r
@@ -44,152 +81,116 @@ def get_hex_center(cell, side):
     y = side * 1.5 * r
     return np.array([x, y])
 
-def get_border_cells(state, hex_map):
-    border_cells = []
-    grid = hex_map.grid
-    for cell in state.cells:
-        r, q = cell.r, cell.q
-        offsets = [(-1, -1), (-1, 0), (0, -1), (0, 1), (1, -1), (1, 0)] if r % 2 == 0 else [(-1, 0), (-1, 1), (0, -1), (0, 1), (1, 0), (1, 1)]
-        for dr, dq in offsets:
-            nr, nq = r + dr, q + dq
-            if 0 <= nr < len(grid) and 0 <= nq < len(grid[0]):
-                neighbor = grid[nr][nq]
-                if neighbor.state_id != cell.state_id:
-                    border_cells.append(cell)
-                    break
-    return border_cells 
+
+def edge_offsets(side):
+    """Концы общего ребра относительно центра клетки для каждого направления: массив (6, 2, 2)."""
+    angles = np.pi / 6 + np.arange(7) * np.pi / 3
+    vertices = side * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    edges = np.array(DIRECTION_EDGE)
+    return np.stack([vertices[edges], vertices[edges + 1]], axis=1)
+
+
+def border_edges(hex_map, group, include):
+    """
+    Рёбра между клетками разных групп: массивы (клетка, направление).
+    group – номер группы каждой клетки, include – маска клеток, чьи границы рисуются.
+    Учитываются только граничные клетки (с соседом другой группы на карте);
+    у них рисуются и рёбра по краю карты. Общее ребро двух таких клеток берётся один раз.
+    """
+    table = hex_map.adjacency.table
+    valid = table >= 0
+    neighbors = np.where(valid, table, 0)
+    neighbor_group = np.where(valid, group[neighbors], group.min() - 1)
+    differs = neighbor_group != group[:, None]
+    border = include & (differs & valid).any(axis=1)
+    index = np.arange(len(group))[:, None]
+    mask = border[:, None] & differs & (~valid | ~border[neighbors] | (index < table))
+    return np.nonzero(mask)
+
+
+def edge_segments(hex_map, side, cells, directions):
+    """Отрезки рёбер (клетка, направление) для LineCollection: массив (n, 2, 2)."""
+    x, y = hex_centers(hex_map.rows, hex_map.cols, side)
+    centers = np.stack([x[cells], y[cells]], axis=1)
+    return centers[:, None, :] + edge_offsets(side)[directions]
+
+
+def _draw_borders(ax, hex_map, hex_size, group, include, **style):
+    cells, directions = border_edges(hex_map, group, include)
+    if len(cells):
+        ax.add_collection(LineCollection(edge_segments(hex_map, hex_size, cells, directions), **style))
+
 
 def draw_separatist_boundaries(ax, hex_map, hex_size):
-    for state in hex_map.states:
-        if state.is_separatist:
-            border_cells = get_border_cells(state, hex_map)
-            if not border_cells:
-                continue
-            centers = np.array([get_hex_center(cell, hex_size) for cell in border_cells])
-            centroid = centers.mean(axis=0)
-            angles = np.arctan2(centers[:,1] - centroid[1], centers[:,0] - centroid[0])
-            sort_order = np.argsort(angles)
-            sorted_centers = centers[sort_order]
-            polygon = Polygon(sorted_centers, closed=True, fill=False, edgecolor='black', linestyle='dashed', linewidth=1)
-            ax.add_patch(polygon)
+    separatists = [state.id for state in hex_map.states if state.is_separatist]
+    if not separatists:
+        return
+    owner = hex_map.arrays.owner.astype(np.int64)
+    _draw_borders(ax, hex_map, hex_size, owner, np.isin(owner, separatists),
+                  colors='black', linestyles='dashed', linewidths=1)
+
 
 def draw_union_boundaries(ax, hex_map, hex_size):
-    if not hasattr(hex_map, 'unions'):
+    if not getattr(hex_map, 'unions', None):
         return
-    grid = hex_map.grid
+    owner = hex_map.arrays.owner.astype(np.int64)
+    # Номер унии по id владельца; последняя строка — для клеток без владельца
+    union_of_state = np.full(max(int(owner.max()), 0) + 2, -1, dtype=np.int64)
     for union in hex_map.unions:
-        union_ids = {s.id for s in union.members}
-        union_cells = []
         for state in union.members:
-            union_cells.extend(state.cells)
-        if not union_cells:
-            continue
-        border_cells = []
-        for cell in union_cells:
-            r, q = cell.r, cell.q
-            offsets = [(-1, -1), (-1, 0), (0, -1), (0, 1), (1, -1), (1, 0)] if r % 2 == 0 else \
-                      [(-1, 0), (-1, 1), (0, -1), (0, 1), (1, 0), (1, 1)]
-            for dr, dq in offsets:
-                nr, nq = r + dr, q + dq
-                if 0 <= nr < len(grid) and 0 <= nq < len(grid[0]):
-                    neighbor = grid[nr][nq]
-                    if neighbor.state_id not in union_ids:
-                        border_cells.append(cell)
-                        break
-        if not border_cells:
-            continue
-        centers = np.array([get_hex_center(cell, hex_size) for cell in border_cells])
-        centroid = centers.mean(axis=0)
-        angles = np.arctan2(centers[:, 1] - centroid[1], centers[:, 0] - centroid[0])
-        sorted_centers = centers[np.argsort(angles)]
-        polygon = Polygon(sorted_centers, closed=True, fill=False,
-                          edgecolor='black', linestyle='solid', linewidth=1)
-        ax.add_patch(polygon)
+            if state.id < len(union_of_state) - 1:
+                union_of_state[state.id] = union.union_id
+    union_of = union_of_state[owner]
+    member = union_of >= 0
+    # Члены одной унии — одна группа, остальные клетки — каждая по своему владельцу
+    group = np.where(member, union_of, -owner - 3)
+    _draw_borders(ax, hex_map, hex_size, group, member,
+                  colors='black', linestyles='solid', linewidths=1)
+
 
 def draw_state_external_borders(ax, hex_map, hex_size):
-    drawn_segments = set()
-    # Смещения для соседей зависят от четности ряда
-    offsets_even = [(-1, -1), (-1, 0), (0, -1), (0, 1), (1, -1), (1, 0)]
-    offsets_odd  = [(-1, 0), (-1, 1), (0, -1), (0, 1), (1, 0), (1, 1)]
-    
-    for state in hex_map.states:
-        border_cells = get_border_cells(state, hex_map)
-        for cell in border_cells:
-            center = get_hex_center(cell, hex_size)
-            # Вычисляем вершины шестиугольника текущей клетки
-            vertices = [center + np.array([np.cos(2*np.pi*i/6 + np.pi/6), np.sin(2*np.pi*i/6 + np.pi/6)]) * hex_size for i in range(6)]
-            # Выбираем набор смещений в зависимости от четности ряда
-            offsets = offsets_even if cell.r % 2 == 0 else offsets_odd
-            for offset in offsets:
-                nr = cell.r + offset[0]
-                nq = cell.q + offset[1]
-                # Если сосед существует и принадлежит тому же государству – пропускаем
-                if 0 <= nr < len(hex_map.grid) and 0 <= nq < len(hex_map.grid[0]):
-                    neighbor = hex_map.grid[nr][nq]
-                    if neighbor.state_id == cell.state_id:
-                        continue
-                    neighbor_center = get_hex_center(neighbor, hex_size)
-                else:
-                    # Вычисляем виртуальный центр соседа, если он вне карты
-                    neighbor_center = np.array([
-                        hex_size * np.sqrt(3) * (nq + 0.5 * (nr % 2)),
-                        hex_size * 1.5 * nr
-                    ])
-                # Вектор от центра текущей клетки к соседу и его угол
-                vec = neighbor_center - center
-                neighbor_angle = np.arctan2(vec[1], vec[0])
-                best_edge = None
-                best_diff = 1e6
-                # Для каждого ребра вычисляем угол направления (по средней точке ребра)
-                for edge in range(6):
-                    pt1 = vertices[edge]
-                    pt2 = vertices[(edge + 1) % 6]
-                    midpoint = (pt1 + pt2) / 2
-                    mid_angle = np.arctan2(midpoint[1] - center[1], midpoint[0] - center[0])
-                    # Нормализуем разницу углов к интервалу [-pi, pi]
-                    diff = abs((neighbor_angle - mid_angle + np.pi) % (2*np.pi) - np.pi)
-                    if diff < best_diff:
-                        best_diff = diff
-                        best_edge = (tuple(pt1), tuple(pt2))
-                # Сортировка концов отрезка для предотвращения дублирования
-                segment = tuple(sorted(best_edge))
-                if segment not in drawn_segments:
-                    drawn_segments.add(segment)
-                    ax.plot([segment[0][0], segment[1][0]], [segment[0][1], segment[1][1]],
-                            color='black', linestyle='solid', linewidth=0.5)
+    owner = hex_map.arrays.owner.astype(np.int64)
+    _draw_borders(ax, hex_map, hex_size, owner, np.isin(owner, [state.id for state in hex_map.states]),
+                  colors='black', linestyles='solid', linewidths=0.5)
 
-def draw_hex_map(hex_map, hex_size=30):
+
+def draw_map(ax, hex_map, hex_size=30, coordinates=True):
+    """Рисует карту на осях ax: клетки, столицы, границы и координаты."""
     rows = hex_map.rows
     cols = hex_map.cols
-    cells = hex_map.get_all_cells()
-    fig, ax = plt.subplots(figsize=(12, 9))
-    draw_hex_grid(ax, hex_size, cells, rows, cols)
+    draw_hex_grid(ax, hex_size, hex_map)
 
     # Добавляем на карту подписи государств (с уменьшенным шрифтом)
     if hasattr(hex_map, 'states'):
-        for state in hex_map.states:
-            if state.capital is not None:
-                center = get_hex_center(state.capital, hex_size)
-                ax.plot(center[0], center[1], marker='*', markersize=5, color='red')
+        capitals = [state for state in hex_map.states if state.capital is not None]
+        if capitals:
+            centers = np.array([get_hex_center(state.capital, hex_size) for state in capitals])
+            ax.plot(centers[:, 0], centers[:, 1], linestyle='none', marker='*', markersize=5, color='red')
+            for state, center in zip(capitals, centers):
                 ax.text(center[0], center[1] + hex_size * 0.3, state.name, fontsize=6, fontweight='bold',
                         color='black', ha='center', va='center')
-                
-    draw_separatist_boundaries(ax, hex_map, hex_size)                
-    draw_state_external_borders(ax, hex_map, hex_size)                
-
-    # === Добавляем координатную сетку по краям ===
-    for r in range(rows):
-        y = r * 1.5 * hex_size
-        ax.text(-hex_size * 0.8, y, str(r), ha='right', va='center', fontsize=6, color='gray')
-        ax.text((cols - 1) * hex_size * np.sqrt(3) + hex_size + 5, y, str(r),
-                ha='left', va='center', fontsize=6, color='gray')
-
-    for q in range(cols):
-        x = q * hex_size * np.sqrt(3)
-        ax.text(x + (hex_size * np.sqrt(3)) * 0.5, -hex_size * 1.2, str(q),
-                ha='center', va='top', fontsize=6, color='gray')
-        ax.text(x + (hex_size * np.sqrt(3)) * 0.5, rows * 1.5 * hex_size + hex_size * 0.5, str(q),
-                ha='center', va='bottom', fontsize=6, color='gray')
-
-    plt.title("Континенты, государства и столицы")
+
+    draw_state_external_borders(ax, hex_map, hex_size)
+    draw_separatist_boundaries(ax, hex_map, hex_size)
+    draw_union_boundaries(ax, hex_map, hex_size)
+
+    if coordinates:
+        draw_coordinate_labels(ax, hex_size, rows, cols)
+    ax.set_title("Континенты, государства и столицы")
+
+
+def render_map(hex_map, path, hex_size=30, dpi=150, coordinates=True):
+    """Рисует карту без окна (Agg) и сохраняет изображение в файл path."""
+    fig = Figure(figsize=(12, 9))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    draw_map(ax, hex_map, hex_size, coordinates)
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+def draw_hex_map(hex_map, hex_size=30):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(12, 9))
+    draw_map(ax, hex_map, hex_size)
     plt.show()